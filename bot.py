@@ -4,6 +4,7 @@ import os
 import sys
 import logging
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from telethon import TelegramClient
@@ -37,6 +38,7 @@ class TelegramFileBot:
         self.web_dashboard: Optional[WebDashboard] = None
         self._cleanup_task: Optional[asyncio.Task] = None
         self._keepalive_task: Optional[asyncio.Task] = None
+        self._fs_pool: Optional[ThreadPoolExecutor] = None
     
     def initialize(self) -> bool:
         """Initialize the bot components.
@@ -85,6 +87,9 @@ class TelegramFileBot:
             # Create downloads directory
             os.makedirs(Config.DOWNLOAD_PATH, exist_ok=True)
             
+            # Filesystem scans (list/search/stats/cleanup) run here, off the event loop
+            self._fs_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fs')
+            
             logger.info("Bot components initialized successfully")
             return True
             
@@ -119,7 +124,8 @@ class TelegramFileBot:
             register_command_handlers(
                 self.main_client,
                 self.file_manager,
-                self.download_manager
+                self.download_manager,
+                fs_executor=self._fs_pool
             )
             register_message_handlers(self.main_client, self.download_manager)
             
@@ -175,10 +181,18 @@ class TelegramFileBot:
         if self.web_dashboard:
             await self.web_dashboard.stop()
         
+        # Stop the download workers while the clients can still edit status messages
+        if self.download_manager:
+            await self.download_manager.close()
+        
         # Disconnect all clients
         for client in (self.bot_client, self.user_client):
             if client and client.is_connected():
                 await client.disconnect()
+        
+        # Drop pending filesystem jobs; a running walk finishes in the background
+        if self._fs_pool:
+            self._fs_pool.shutdown(wait=False, cancel_futures=True)
 
         logger.info("Bot stopped")
     
@@ -190,7 +204,11 @@ class TelegramFileBot:
                 await asyncio.sleep(24 * 60 * 60)
                 
                 if Config.AUTO_CLEANUP_DAYS > 0:
-                    result = self.file_manager.cleanup_old_files(Config.AUTO_CLEANUP_DAYS)
+                    # The directory walk and deletions run in a worker thread so a
+                    # large cleanup does not stall message dispatch
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self._fs_pool, self.file_manager.cleanup_old_files, Config.AUTO_CLEANUP_DAYS
+                    )
                     if result['deleted_count'] > 0:
                         logger.info(
                             f"Auto-cleanup: deleted {result['deleted_count']} files "
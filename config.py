@@ -1,8 +1,9 @@
 """Configuration management for the Telegram File Bot."""
 
 import os
+import math
 import logging
-from typing import List, Optional
+from typing import Callable, FrozenSet, List, Optional
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
@@ -16,6 +17,49 @@ class ConfigError(Exception):
     pass
 
 
+# Settings read by Config.load(): (name, default, type)
+_SCHEMA = (
+    # Bot/User Credentials
+    ('BOT_TOKEN', '', str),
+    ('SESSION_STRING', '', str),
+    ('API_ID', 0, int),
+    ('API_HASH', '', str),
+    # User Authorization
+    ('ALLOWED_USERS', frozenset(), frozenset),
+    # Bot Settings
+    ('DOWNLOAD_PATH', 'downloads', str),
+    ('MAX_CONCURRENT_DOWNLOADS', 3, int),
+    ('MAX_QUEUE_SIZE', 100, int),
+    ('CACHE_TTL', 30, int),
+    ('UPDATE_INTERVAL', 1, int),
+    # Group Support
+    ('ALLOW_GROUP_MESSAGES', False, bool),
+    # Auto Cleanup
+    ('AUTO_CLEANUP_DAYS', 0, int),
+    # Retry Settings
+    ('MAX_RETRIES', 5, int),
+    ('DOWNLOAD_TIMEOUT', 7200, int),
+    # Disk
+    ('PREALLOCATE_DOWNLOADS', True, bool),
+    # Progress Updates
+    ('PROGRESS_TICK_MIN', 0.25, float),
+    ('PROGRESS_TICK_MAX', 10.0, float),
+)
+
+
+# Callbacks run after every Config.load(), e.g. to drop caches derived from settings
+_reload_hooks: List[Callable[[], None]] = []
+
+
+def on_reload(callback: Callable[[], None]) -> None:
+    """Register a callback to run whenever the configuration is (re)loaded.
+    
+    Args:
+        callback: Function called with no arguments after settings are refreshed
+    """
+    _reload_hooks.append(callback)
+
+
 class Config:
     """Application configuration container."""
     
@@ -26,11 +70,12 @@ class Config:
     API_HASH: str = ""
     
     # User Authorization
-    ALLOWED_USERS: List[int] = []
+    ALLOWED_USERS: FrozenSet[int] = frozenset()
     
     # Bot Settings
     DOWNLOAD_PATH: str = "downloads"
     MAX_CONCURRENT_DOWNLOADS: int = 3
+    MAX_QUEUE_SIZE: int = 100
     CACHE_TTL: int = 30
     UPDATE_INTERVAL: int = 1
     
@@ -44,71 +89,113 @@ class Config:
     MAX_RETRIES: int = 5
     DOWNLOAD_TIMEOUT: int = 7200  # Default 2 hours
     
+    # Disk
+    PREALLOCATE_DOWNLOADS: bool = True
+    
+    # Progress Updates (seconds between progress checks)
+    PROGRESS_TICK_MIN: float = 0.25
+    PROGRESS_TICK_MAX: float = 10.0
+    
     _validated: bool = False
     
     @classmethod
     def load(cls) -> None:
-        """Load configuration from environment variables."""
-        cls.BOT_TOKEN = os.getenv('BOT_TOKEN', '')
-        cls.SESSION_STRING = os.getenv('SESSION_STRING', '')
-        cls.API_HASH = os.getenv('API_HASH', '')
+        """Load configuration from environment variables.
         
-        # Parse API_ID
-        api_id_str = os.getenv('API_ID', '')
-        if api_id_str:
-            try:
-                cls.API_ID = int(api_id_str)
-            except ValueError:
-                cls.API_ID = 0
-        
-        # Parse ALLOWED_USERS
-        raw_allowed_users = os.getenv('ALLOWED_USERS', '')
-        cls.ALLOWED_USERS = []
-        if raw_allowed_users:
-            for user_id in raw_allowed_users.split(','):
-                user_id = user_id.strip()
-                if user_id:
-                    try:
-                        cls.ALLOWED_USERS.append(int(user_id))
-                    except ValueError:
-                        logger.warning(f"Invalid user ID in ALLOWED_USERS: {user_id}")
-        
-        # Bot Settings
-        cls.DOWNLOAD_PATH = os.getenv('DOWNLOAD_PATH', 'downloads')
-        cls.MAX_CONCURRENT_DOWNLOADS = cls._parse_int('MAX_CONCURRENT_DOWNLOADS', 3)
-        cls.CACHE_TTL = cls._parse_int('CACHE_TTL', 30)
-        cls.UPDATE_INTERVAL = cls._parse_int('UPDATE_INTERVAL', 1)
+        Reads every setting in `_SCHEMA` in a single pass and refreshes both
+        the class attributes and the module-level aliases.
+        """
+        env = os.environ
+        values = {}
+        for name, default, kind in _SCHEMA:
+            raw = env.get(name, '')
+            if not raw:
+                values[name] = default
+            elif kind is int:
+                values[name] = cls._parse_int(name, raw, default)
+            elif kind is float:
+                values[name] = cls._parse_float(name, raw, default)
+            elif kind is bool:
+                values[name] = raw.lower() == 'true'
+            elif kind is frozenset:
+                values[name] = cls._parse_user_ids(raw)
+            else:
+                values[name] = raw
         
-        # Group Support
-        cls.ALLOW_GROUP_MESSAGES = os.getenv('ALLOW_GROUP_MESSAGES', 'false').lower() == 'true'
+        for name, value in values.items():
+            setattr(cls, name, value)
+        globals().update(values)
         
-        # Auto Cleanup
-        cls.AUTO_CLEANUP_DAYS = cls._parse_int('AUTO_CLEANUP_DAYS', 0)
+        for hook in _reload_hooks:
+            hook()
+    
+    @classmethod
+    def _parse_user_ids(cls, value: str) -> FrozenSet[int]:
+        """Parse a comma-separated list of user IDs.
         
-        # Retry Settings
-        cls.MAX_RETRIES = cls._parse_int('MAX_RETRIES', 5)
-        cls.DOWNLOAD_TIMEOUT = cls._parse_int('DOWNLOAD_TIMEOUT', 7200)
+        Args:
+            value: Raw ALLOWED_USERS value
+            
+        Returns:
+            Frozenset of user IDs (membership is checked on every incoming event)
+        """
+        user_ids = set()
+        for user_id in value.split(','):
+            user_id = user_id.strip()
+            if user_id:
+                try:
+                    user_ids.add(int(user_id))
+                except ValueError:
+                    logger.warning(f"Invalid user ID in ALLOWED_USERS: {user_id}")
+        return frozenset(user_ids)
     
     @classmethod
-    def _parse_int(cls, env_var: str, default: int) -> int:
-        """Safely parse an integer from environment variable.
+    def _parse_int(cls, env_var: str, value: str, default: int) -> int:
+        """Safely parse an integer from an environment variable value.
         
         Args:
-            env_var: Environment variable name
+            env_var: Environment variable name (used in the warning)
+            value: Raw environment variable value
             default: Default value if parsing fails
             
         Returns:
             Parsed integer or default value
         """
-        value = os.getenv(env_var, '')
         if not value:
             return default
+        # Plain (optionally signed) digit strings are the common case; isdecimal()
+        # rather than isdigit() because int() rejects digits like '²'
+        digits = value[1:] if value[0] in ('-', '+') else value
+        if digits.isdecimal():
+            return int(value)
         try:
             return int(value)
         except ValueError:
             logger.warning(f"Invalid integer for {env_var}: '{value}', using default: {default}")
             return default
     
+    @classmethod
+    def _parse_float(cls, env_var: str, value: str, default: float) -> float:
+        """Safely parse a positive, finite float from an environment variable value.
+        
+        Args:
+            env_var: Environment variable name (used in the warning)
+            value: Raw environment variable value
+            default: Default value if parsing fails
+            
+        Returns:
+            Parsed float or default value
+        """
+        try:
+            result = float(value)
+        except ValueError:
+            result = None
+        # float() also accepts 'nan'/'inf', which would break asyncio.sleep() arithmetic
+        if result is None or not math.isfinite(result) or result <= 0:
+            logger.warning(f"Invalid number for {env_var}: '{value}', using default: {default}")
+            return default
+        return result
+    
     @classmethod
     def validate(cls) -> None:
         """Validate essential configuration variables.
@@ -164,7 +251,7 @@ def _get_api_hash() -> str:
     return Config.API_HASH
 
 def _get_allowed_users() -> List[int]:
-    return Config.ALLOWED_USERS
+    return sorted(Config.ALLOWED_USERS)
 
 def _get_download_path() -> str:
     return Config.DOWNLOAD_PATH
@@ -173,9 +260,8 @@ def _get_max_concurrent_downloads() -> int:
     return Config.MAX_CONCURRENT_DOWNLOADS
 
 
-# For backward compatibility, load config on import
-Config.load()
-
+# Backward compatibility - module-level aliases hold the defaults until
+# Config.load() (called from Config.validate()) refreshes them
 BOT_TOKEN = Config.BOT_TOKEN
 SESSION_STRING = Config.SESSION_STRING
 API_ID = Config.API_ID
@@ -183,9 +269,13 @@ API_HASH = Config.API_HASH
 ALLOWED_USERS = Config.ALLOWED_USERS
 DOWNLOAD_PATH = Config.DOWNLOAD_PATH
 MAX_CONCURRENT_DOWNLOADS = Config.MAX_CONCURRENT_DOWNLOADS
+MAX_QUEUE_SIZE = Config.MAX_QUEUE_SIZE
 CACHE_TTL = Config.CACHE_TTL
 UPDATE_INTERVAL = Config.UPDATE_INTERVAL
 ALLOW_GROUP_MESSAGES = Config.ALLOW_GROUP_MESSAGES
 AUTO_CLEANUP_DAYS = Config.AUTO_CLEANUP_DAYS
 MAX_RETRIES = Config.MAX_RETRIES
 DOWNLOAD_TIMEOUT = Config.DOWNLOAD_TIMEOUT
+PREALLOCATE_DOWNLOADS = Config.PREALLOCATE_DOWNLOADS
+PROGRESS_TICK_MIN = Config.PROGRESS_TICK_MIN
+PROGRESS_TICK_MAX = Config.PROGRESS_TICK_MAX
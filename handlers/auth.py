@@ -1,5 +1,6 @@
 """User authentication and authorization module."""
 
+import functools
 import logging
 
 import config
@@ -31,15 +32,18 @@ def is_chat_allowed(event) -> bool:
     Returns:
         True if chat is allowed, False otherwise
     """
-    # Always allow private chats for authorized users
-    if event.is_private:
-        return is_user_allowed(event.sender_id)
-    
-    # Check group permission
-    if config.ALLOW_GROUP_MESSAGES:
-        return is_user_allowed(event.sender_id)
-    
-    return False
+    return _allowed(event.is_private, event.sender_id)
+
+
+@functools.lru_cache(maxsize=1024)
+def _allowed(is_private: bool, sender_id: int) -> bool:
+    """Memoized chat/user check behind is_chat_allowed; cleared on config reload."""
+    # Private chats are always open to authorized users; groups only when enabled.
+    # The chat check runs first so disallowed groups skip the user lookup.
+    return (is_private or config.ALLOW_GROUP_MESSAGES) and is_user_allowed(sender_id)
+
+
+config.on_reload(_allowed.cache_clear)
 
 
 def get_user_display_name(event) -> str:
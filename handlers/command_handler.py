@@ -2,62 +2,40 @@
 
 import logging
 import asyncio
-from typing import Callable, Awaitable, Any, List
+import functools
+import re
+from concurrent.futures import Executor
+from typing import Callable, Awaitable, Any, List, Optional, Tuple
 
 from telethon import events, Button
 from telethon.tl.types import Message
 
 from utils.download_manager import DownloadManager
-from utils.file_manager import FileManager
+from utils.file_manager import FileManager, FileInfo
+from utils.helpers import TokenBucket
 from .auth import is_user_allowed, is_chat_allowed
 import config
 
 logger = logging.getLogger(__name__)
 
-
-def register_command_handlers(
-    bot,
-    file_manager: FileManager,
-    download_manager: DownloadManager
-) -> None:
-    """Register all command handlers with the bot.
-    
-    Args:
-        bot: Telethon client instance
-        file_manager: FileManager instance
-        download_manager: DownloadManager instance
-    """
-    
-    def create_command_handler(pattern: str) -> Callable:
-        """Decorator factory for command handlers with auth and error handling."""
-        def decorator(handler_func: Callable[..., Awaitable[Any]]) -> Callable:
-            @bot.on(events.NewMessage(pattern=pattern))
-            async def command_wrapper(event: Message) -> None:
-                if not is_chat_allowed(event):
-                    await event.respond("⛔ You are not authorized to use this bot.")
-                    raise events.StopPropagation
-                
-                try:
-                    await handler_func(event)
-                except Exception as e:
-                    logger.error(
-                        f"Command '{pattern}' error for user {event.sender_id}: {e}",
-                        exc_info=True
-                    )
-                    await event.respond(f"❌ An unexpected error occurred: {str(e)}")
-                finally:
-                    raise events.StopPropagation
-            return command_wrapper
-        return decorator
-
-    @bot.on(events.NewMessage(pattern='/start'))
-    async def start_command(event: Message) -> None:
-        """Handle /start command - show help message."""
-        if not is_chat_allowed(event):
-            await event.respond("⛔ You are not authorized to use this bot.")
-            return
-        
-        help_text = """
+# Command patterns compiled once at import; Telethon calls `.match` on them directly
+_COMMAND_PATTERNS = {
+    'start': re.compile(r'/start'),
+    'list': re.compile(r'/list(?: (\d+))?'),
+    'search': re.compile(r'/search (.+)'),
+    'rename': re.compile(r'/rename (\d+) (.+)'),
+    'delete': re.compile(r'/delete (\d+)'),
+    'cancel': re.compile(r'/cancel (\S+)'),
+    'active': re.compile(r'/active'),
+    'queue': re.compile(r'/queue'),
+    'stats': re.compile(r'/stats'),
+    'cleanup': re.compile(r'/cleanup'),
+    'autocleanup': re.compile(r'/autocleanup(?: (\d+))?'),
+}
+_PAGE_CALLBACK_PATTERN = re.compile(rb'page_(\d+)')
+_USER_RETRY_CALLBACK_PATTERN = re.compile(rb'userretry_(.+)')
+
+_HELP_TEXT = """
 📥 **Telegram File Manager Bot** 📥
 
 This bot helps you manage file downloads.
@@ -80,97 +58,148 @@ This bot helps you manage file downloads.
 - Send public Telegram post links to download
 
 Files are stored in a `YYYYMMDD` dated folder structure.
-        """
-        await event.respond(help_text)
-        raise events.StopPropagation
+"""
 
-    @create_command_handler(r'/list(?: (\d+))?')
-    async def list_command(event: Message) -> None:
-        """Handle /list command - list downloaded files with pagination."""
-        page = 1
-        is_callback = hasattr(event, 'data') and event.data
+_UNAUTHORIZED = "⛔ You are not authorized to use this bot."
+_UNAUTHORIZED_ANSWER_CACHE_TIME = 3600  # seconds
+_SEARCH_RESULTS_LIMIT = 20  # matches shown per /search
 
-        if is_callback:
-            page = int(event.data.decode('utf-8').split('_')[1])
-        elif event.pattern_match.group(1):
-            page = int(event.pattern_match.group(1))
+# Caps concurrent FileManager calls (directory walks) across all chats
+_fs_semaphore = asyncio.BoundedSemaphore(2)
 
-        page_size = 10
-        files = file_manager.list_files()
+# Telegram's bot-wide outbound limit (messages per second)
+_SEND_RATE = 30
+_send_limiter = TokenBucket(_SEND_RATE)
 
-        if not files:
-            message = "📂 No files have been downloaded yet."
-            if is_callback:
-                await event.edit(message)
-            else:
-                await event.respond(message)
-            return
 
-        total_pages = (len(files) + page_size - 1) // page_size
-        page = max(1, min(page, total_pages))
-        start_idx = (page - 1) * page_size
-        paged_files = files[start_idx:start_idx + page_size]
+async def _respond(event: Message, *args: Any, **kwargs: Any) -> Message:
+    """Reply to an event once the outbound rate limiter allows it."""
+    await _send_limiter.acquire()
+    return await event.respond(*args, **kwargs)
+
+
+async def _safe_call(handler_func: Callable[..., Awaitable[Any]], event: Message) -> None:
+    """Run a command handler, report unexpected errors and stop propagation.
+    
+    Args:
+        handler_func: Command handler coroutine function
+        event: Telethon event that matched the command
+    """
+    try:
+        await handler_func(event)
+    except Exception as e:
+        logger.error(
+            f"Command '{handler_func.__name__}' error for user {event.sender_id}: {e}",
+            exc_info=True
+        )
+        await _respond(event, f"❌ An unexpected error occurred: {str(e)}")
+    raise events.StopPropagation
+
+
+def register_command_handlers(
+    bot,
+    file_manager: FileManager,
+    download_manager: DownloadManager,
+    fs_executor: Optional[Executor] = None
+) -> None:
+    """Register all command handlers with the bot.
+    
+    Args:
+        bot: Telethon client instance
+        file_manager: FileManager instance
+        download_manager: DownloadManager instance
+        fs_executor: Executor for blocking FileManager calls (loop default if None)
+    """
+    
+    async def run_fs(func: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking FileManager call on the filesystem executor."""
+        async with _fs_semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(fs_executor, func, *args)
+    
+    def create_command_handler(command: str) -> Callable:
+        """Decorator factory for command handlers with auth and error handling.
+
+        Authorization is applied as a Telethon event filter, so events from
+        unauthorized chats are dropped before a handler coroutine is created.
+        The decorated function is returned unwrapped.
+        """
+        builder = events.NewMessage(pattern=_COMMAND_PATTERNS[command], func=is_chat_allowed)
 
-        response = f"📂 **Downloaded Files** (Page {page}/{total_pages}):\n\n"
-        for idx, file_info in enumerate(paged_files, start_idx + 1):
-            response += f"{idx}. `{file_info['relative_path']}`\n"
-            response += f"   Size: {file_info['size']}\n\n"
+        def decorator(handler_func: Callable[..., Awaitable[Any]]) -> Callable:
+            bot.add_event_handler(functools.partial(_safe_call, handler_func), builder)
+            return handler_func
+        return decorator
 
-        buttons = _build_pagination_buttons(page, total_pages)
+    @bot.on(events.NewMessage(pattern=_COMMAND_PATTERNS['start']))
+    async def start_command(event: Message) -> None:
+        """Handle /start command - show help message."""
+        if not is_chat_allowed(event):
+            await _respond(event, _UNAUTHORIZED)
+            return
         
-        if is_callback:
-            await event.edit(response, buttons=buttons or None)
-        else:
-            await event.respond(response, buttons=buttons or None)
+        await _respond(event, _HELP_TEXT)
+        raise events.StopPropagation
 
-    @create_command_handler(r'/search (.+)')
+    @create_command_handler('list')
+    async def list_command(event: Message) -> None:
+        """Handle /list command - list downloaded files with pagination."""
+        page = int(event.pattern_match.group(1) or 1)
+        files = await run_fs(file_manager.list_files)
+        text, buttons = _render_list_page(files, page)
+        await _respond(event, text, buttons=buttons or None)
+
+    @create_command_handler('search')
     async def search_command(event: Message) -> None:
         """Handle /search command - search files by name."""
         query = event.pattern_match.group(1).strip()
         
         if not query:
-            await event.respond("❌ Please provide a search query.\nUsage: `/search <query>`")
+            await _respond(event, "❌ Please provide a search query.\nUsage: `/search <query>`")
             return
         
-        files = file_manager.search_files(query)
+        # Only the first page of matches is built; the rest are just counted
+        files = await run_fs(file_manager.search_files, query, _SEARCH_RESULTS_LIMIT)
         
         if not files:
-            await event.respond(f"🔍 No files found matching: `{query}`")
+            await _respond(event, f"🔍 No files found matching: `{query}`")
             return
         
-        response = f"🔍 **Search Results for:** `{query}`\n\n"
-        for idx, file_info in enumerate(files[:20], 1):  # Limit to 20 results
-            response += f"{idx}. `{file_info['relative_path']}`\n"
-            response += f"   Size: {file_info['size']}\n\n"
+        parts = [f"🔍 **Search Results for:** `{query}`\n\n"]
+        for idx, file_info in enumerate(files, 1):
+            parts.append(f"{idx}. `{file_info.relative_path}`\n")
+            parts.append(f"   Size: {file_info.size}\n\n")
         
-        if len(files) > 20:
-            response += f"\n_...and {len(files) - 20} more results_"
+        if len(files) == _SEARCH_RESULTS_LIMIT:
+            total = await run_fs(file_manager.count_matches, query)
+            if total > _SEARCH_RESULTS_LIMIT:
+                parts.append(f"\n_...and {total - _SEARCH_RESULTS_LIMIT} more results_")
         
-        await event.respond(response)
+        await _respond(event, ''.join(parts))
 
-    @create_command_handler(r'/rename (\d+) (.+)')
+    @create_command_handler('rename')
     async def rename_command(event: Message) -> None:
         """Handle /rename command - rename a file by index."""
         index = int(event.pattern_match.group(1))
         new_name = event.pattern_match.group(2).strip()
         
-        result = file_manager.rename_file(index - 1, new_name)
+        result = await run_fs(file_manager.rename_file, index - 1, new_name)
         if result['success']:
-            await event.respond(f"✅ File renamed to: `{result['new_relative_path']}`")
+            await _respond(event, f"✅ File renamed to: `{result['new_relative_path']}`")
         else:
-            await event.respond(f"❌ Error: {result['message']}")
+            await _respond(event, f"❌ Error: {result['message']}")
 
-    @create_command_handler(r'/delete (\d+)')
+    @create_command_handler('delete')
     async def delete_command(event: Message) -> None:
         """Handle /delete command - delete a file by index."""
         index = int(event.pattern_match.group(1))
-        result = file_manager.delete_file(index - 1)
+        result = await run_fs(file_manager.delete_file, index - 1)
         if result['success']:
-            await event.respond(f"✅ File deleted: `{result['deleted_path']}`")
+            await _respond(event, f"✅ File deleted: `{result['deleted_path']}`")
         else:
-            await event.respond(f"❌ Error: {result['message']}")
+            await _respond(event, f"❌ Error: {result['message']}")
 
-    @create_command_handler(r'/cancel (\S+)')
+    @create_command_handler('cancel')
     async def cancel_command(event: Message) -> None:
         """Handle /cancel command - cancel an active or queued download."""
         download_id = event.pattern_match.group(1)
@@ -178,13 +207,13 @@ Files are stored in a `YYYYMMDD` dated folder structure.
         
         if result['success']:
             if result.get('was_queued'):
-                await event.respond(f"✅ Queued download cancelled: `{result['filename']}`")
+                await _respond(event, f"✅ Queued download cancelled: `{result['filename']}`")
             else:
-                await event.respond(f"✅ Download cancelled: `{result['filename']}`")
+                await _respond(event, f"✅ Download cancelled: `{result['filename']}`")
         else:
-            await event.respond(f"❌ Error: {result['message']}")
+            await _respond(event, f"❌ Error: {result['message']}")
 
-    @create_command_handler(r'/active')
+    @create_command_handler('active')
     async def active_downloads_command(event: Message) -> None:
         """Handle /active command - show active downloads."""
         downloads = download_manager.list_active_downloads()
@@ -194,40 +223,40 @@ Files are stored in a `YYYYMMDD` dated folder structure.
         if not downloads:
             response = "📥 No active downloads.\n\n"
             response += f"📊 **Status**: {total_active}/{max_concurrent} slots used"
-            await event.respond(response)
+            await _respond(event, response)
             return
         
-        response = f"📥 **Active Downloads** ({len(downloads)}):\n\n"
+        parts = [f"📥 **Active Downloads** ({len(downloads)}):\n\n"]
         for idx, (download_id, info) in enumerate(downloads.items(), 1):
             percentage = int(info['downloaded'] * 100 / max(info['size'], 1))
-            response += f"{idx}. `{info['filename']}`\n"
-            response += f"   Progress: {percentage}%, ID: `{download_id}`\n\n"
+            parts.append(f"{idx}. `{info['filename']}`\n")
+            parts.append(f"   Progress: {percentage}%, ID: `{download_id}`\n\n")
         
-        response += f"📊 **Slots**: {total_active}/{max_concurrent} used\n"
-        response += "To cancel: `/cancel <download_id>`"
-        await event.respond(response)
+        parts.append(f"📊 **Slots**: {total_active}/{max_concurrent} used\n")
+        parts.append("To cancel: `/cancel <download_id>`")
+        await _respond(event, ''.join(parts))
 
-    @create_command_handler(r'/queue')
+    @create_command_handler('queue')
     async def queue_command(event: Message) -> None:
         """Handle /queue command - show queued downloads."""
         queued = download_manager.list_queued_downloads()
         
         if not queued:
-            await event.respond("📋 No downloads in queue.")
+            await _respond(event, "📋 No downloads in queue.")
             return
         
-        response = f"📋 **Download Queue** ({len(queued)} items):\n\n"
+        parts = [f"📋 **Download Queue** ({len(queued)} items):\n\n"]
         for item in queued:
-            response += f"#{item['position']}. `{item['filename']}`\n"
-            response += f"   ID: `{item['download_id']}`\n\n"
+            parts.append(f"#{item['position']}. `{item['filename']}`\n")
+            parts.append(f"   ID: `{item['download_id']}`\n\n")
         
-        response += "To cancel: `/cancel <download_id>`"
-        await event.respond(response)
+        parts.append("To cancel: `/cancel <download_id>`")
+        await _respond(event, ''.join(parts))
 
-    @create_command_handler(r'/stats')
+    @create_command_handler('stats')
     async def stats_command(event: Message) -> None:
         """Handle /stats command - show download statistics."""
-        stats = file_manager.get_stats()
+        stats = await run_fs(file_manager.get_stats)
         active = len(download_manager.list_active_downloads())
         queued = len(download_manager.list_queued_downloads())
         
@@ -238,40 +267,44 @@ Files are stored in a `YYYYMMDD` dated folder structure.
         response += f"📋 Queued Downloads: {queued}\n"
         response += f"🔢 Max Concurrent: {download_manager.max_concurrent_downloads}"
         
-        await event.respond(response)
+        await _respond(event, response)
 
-    @create_command_handler(r'/cleanup')
+    @create_command_handler('cleanup')
     async def cleanup_command(event: Message) -> None:
         """Handle /cleanup command - clean up completed downloads."""
-        before_count = len(download_manager.active_downloads)
-        download_manager._cleanup_completed_downloads()
+        # Count what this call removed rather than diffing len() around it, so the
+        # reply can't include records dropped by another code path
+        cleaned = download_manager._cleanup_completed_downloads()
         after_count = len(download_manager.active_downloads)
-        cleaned = before_count - after_count
         
         if cleaned > 0:
-            await event.respond(
+            await _respond(
+                event,
                 f"✅ Cleaned up {cleaned} completed download(s).\n"
                 f"📊 **Slots**: {after_count}/{download_manager.max_concurrent_downloads} used"
             )
         else:
-            await event.respond(
+            await _respond(
+                event,
                 f"ℹ️ No completed downloads to clean up.\n"
                 f"📊 **Slots**: {after_count}/{download_manager.max_concurrent_downloads} used"
             )
 
-    @create_command_handler(r'/autocleanup(?: (\d+))?')
+    @create_command_handler('autocleanup')
     async def autocleanup_command(event: Message) -> None:
         """Handle /autocleanup command - clean up old files."""
         days_str = event.pattern_match.group(1)
         
         if not days_str:
             if config.AUTO_CLEANUP_DAYS > 0:
-                await event.respond(
+                await _respond(
+                    event,
                     f"ℹ️ Auto cleanup is set to {config.AUTO_CLEANUP_DAYS} days.\n"
                     f"Use `/autocleanup <days>` to clean files older than specified days."
                 )
             else:
-                await event.respond(
+                await _respond(
+                    event,
                     "ℹ️ Auto cleanup is disabled.\n"
                     "Use `/autocleanup <days>` to clean files older than specified days."
                 )
@@ -279,38 +312,45 @@ Files are stored in a `YYYYMMDD` dated folder structure.
         
         days = int(days_str)
         if days <= 0:
-            await event.respond("❌ Days must be a positive number.")
+            await _respond(event, "❌ Days must be a positive number.")
             return
         
-        result = file_manager.cleanup_old_files(days)
+        result = await run_fs(file_manager.cleanup_old_files, days)
         
         if result['success']:
             if result['deleted_count'] > 0:
-                await event.respond(
+                await _respond(
+                    event,
                     f"✅ Cleaned up {result['deleted_count']} file(s) older than {days} days."
                 )
             else:
-                await event.respond(f"ℹ️ No files older than {days} days found.")
+                await _respond(event, f"ℹ️ No files older than {days} days found.")
         else:
-            await event.respond(f"❌ Error: {result['message']}")
+            await _respond(event, f"❌ Error: {result['message']}")
 
     # Pagination callback handler
-    @bot.on(events.CallbackQuery(pattern=b"page_(\\d+)"))
+    @bot.on(events.CallbackQuery(pattern=_PAGE_CALLBACK_PATTERN))
     async def page_callback_handler(event) -> None:
         """Handle pagination button clicks."""
         if not is_user_allowed(event.sender_id):
-            await event.answer("⛔ You are not authorized to use this bot.")
+            # Empty answer, cached client-side so repeated clicks send nothing
+            await event.answer(cache_time=_UNAUTHORIZED_ANSWER_CACHE_TIME)
             return
         
-        await list_command(event)
+        # Callback data is b"page_<n>"; int() parses the ASCII digits straight from bytes
+        page = int(event.data[5:])
+        files = await run_fs(file_manager.list_files)
+        text, buttons = _render_list_page(files, page)
+        await event.edit(text, buttons=buttons or None)
         await event.answer()
 
     # 「用老号重试」回调处理器
-    @bot.on(events.CallbackQuery(pattern=b"userretry_(.+)"))
+    @bot.on(events.CallbackQuery(pattern=_USER_RETRY_CALLBACK_PATTERN))
     async def user_retry_callback_handler(event) -> None:
         """处理「🔁 用老号重试」按钮：用老号（回退客户端）重下登记的链接。"""
         if not is_user_allowed(event.sender_id):
-            await event.answer("⛔ You are not authorized to use this bot.")
+            # Empty answer, cached client-side so repeated clicks send nothing
+            await event.answer(cache_time=_UNAUTHORIZED_ANSWER_CACHE_TIME)
             return
 
         token = event.pattern_match.group(1).decode('utf-8')
@@ -323,6 +363,37 @@ Files are stored in a `YYYYMMDD` dated folder structure.
         asyncio.create_task(download_manager.retry_download_via_fallback(token))
 
 
+def _render_list_page(
+    files: List[FileInfo],
+    page: int,
+    page_size: int = 10
+) -> Tuple[str, List[List[Button]]]:
+    """Render one page of the file listing.
+    
+    Args:
+        files: Records from FileManager.list_files()
+        page: Requested page number (clamped to the valid range)
+        page_size: Number of files per page
+        
+    Returns:
+        Tuple of (message text, pagination button rows)
+    """
+    if not files:
+        return "📂 No files have been downloaded yet.", []
+
+    total_pages = (len(files) + page_size - 1) // page_size
+    page = max(1, min(page, total_pages))
+    start_idx = (page - 1) * page_size
+    paged_files = files[start_idx:start_idx + page_size]
+
+    parts = [f"📂 **Downloaded Files** (Page {page}/{total_pages}):\n\n"]
+    for idx, file_info in enumerate(paged_files, start_idx + 1):
+        parts.append(f"{idx}. `{file_info.relative_path}`\n")
+        parts.append(f"   Size: {file_info.size}\n\n")
+
+    return ''.join(parts), _build_pagination_buttons(page, total_pages)
+
+
 def _build_pagination_buttons(page: int, total_pages: int) -> List[List[Button]]:
     """Build pagination buttons for file listing.
     
@@ -333,29 +404,35 @@ def _build_pagination_buttons(page: int, total_pages: int) -> List[List[Button]]
     Returns:
         List of button rows
     """
+    return [list(row) for row in _cached_pagination_buttons(page, total_pages)]
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_pagination_buttons(page: int, total_pages: int) -> Tuple[Tuple[Button, ...], ...]:
+    """Build the pagination rows for a page, memoized per (page, total_pages).
+    
+    The rows are identical for every user, and Telethon serializes the
+    button objects per request, so they can be shared between replies.
+    """
     if total_pages <= 1:
-        return []
+        return ()
     
-    buttons: List[List[Button]] = []
     row: List[Button] = []
     max_buttons = 5
 
     if page > 1:
-        row.append(Button.inline("◀️ Prev", f"page_{page - 1}"))
+        row.append(Button.inline("◀️ Prev", b"page_%d" % (page - 1)))
 
     start_page = max(1, min(page - max_buttons // 2, total_pages - max_buttons + 1))
     end_page = min(total_pages, start_page + max_buttons - 1)
 
     for p in range(start_page, end_page + 1):
         if p == page:
-            row.append(Button.inline(f"[{p}]", f"page_{p}"))
+            row.append(Button.inline(f"[{p}]", b"page_%d" % p))
         else:
-            row.append(Button.inline(str(p), f"page_{p}"))
+            row.append(Button.inline(str(p), b"page_%d" % p))
 
     if page < total_pages:
-        row.append(Button.inline("Next ▶️", f"page_{page + 1}"))
-    
-    if row:
-        buttons.append(row)
+        row.append(Button.inline("Next ▶️", b"page_%d" % (page + 1)))
     
-    return buttons
+    return (tuple(row),) if row else ()
@@ -1,15 +1,18 @@
 """Message handlers for processing files and links."""
 
+import asyncio
 import logging
 import re
-from datetime import datetime
-from typing import Optional, List
+import time
+from typing import Any, Optional, List
 
 from telethon import events, Button
+from telethon.errors import FloodWaitError, MessageNotModifiedError, RPCError
 from telethon.tl.types import (
-    DocumentAttributeFilename,
     MessageMediaPhoto,
     MessageMediaWebPage,
+    MessageEntityTextUrl,
+    MessageEntityUrl,
     Message
 )
 
@@ -19,6 +22,26 @@ import config
 
 logger = logging.getLogger(__name__)
 
+# 正则匹配基本的 https://t.me/... 链接，并过滤末尾可能粘连的中文句号或括号等非URL字符
+# 末尾可选捕获 ?comment=/?thread= 等查询串（评论/话题链接），否则会被截断丢失
+_TG_LINK_RE = re.compile(r'https?://(?:t\.me|telegram\.me)/[a-zA-Z0-9_/%+-]+(?:\?[a-zA-Z0-9_=&]+)?')
+_TG_PREFIXES = ("https://t.me/", "http://t.me/", "https://telegram.me/", "http://telegram.me/")
+
+# Links from one message resolved/downloaded at the same time
+_LINK_CONCURRENCY = 4
+
+# Status message templates
+_MSG_STARTING = "⏳ Starting download...\n\nTo cancel: `/cancel {}`"
+_MSG_DL_FAIL = "❌ Download failed: {}"
+_MSG_LINK = "⏳ Processing link{}...\n{}"
+_MSG_LINK_FAIL = "❌ Error processing link ({}): {}\n{}"
+_MSG_LINK_RETRY = "❌ @bot 无法下载该链接（可能是禁止转发/私有频道）。\n{}\n\n👇 点下方用老号重试："
+_MSG_BATCH_DONE = "✅ Batch processing complete!\nSuccessfully added: {}\nFailed: {}"
+_MSG_FWD_NO_MEDIA = "⚠️ 该转发消息似乎没有携带媒体文件。这可能是 Telegram 的版权保护限制，或者转发时未包含附件。"
+
+# [second, formatted timestamp] for generated filenames; see _timestamp()
+_timestamp_cache: List[Any] = [0, '']
+
 
 def register_message_handlers(bot, download_manager: DownloadManager) -> None:
     """Register handlers for non-command messages.
@@ -28,61 +51,85 @@ def register_message_handlers(bot, download_manager: DownloadManager) -> None:
         download_manager: DownloadManager instance
     """
 
-    @bot.on(events.NewMessage)
-    async def message_handler(event: Message) -> None:
-        """Handle incoming messages with files or links."""
-        # Ignore outgoing messages
-        if event.out:
-            return
-        
-        # Check chat permissions
-        if not is_chat_allowed(event):
-            if not event.is_private:
-                return  # Silently ignore group messages if not allowed
-            logger.warning(f"Ignored message from unauthorized user: {event.sender_id}")
-            return
+    @bot.on(events.NewMessage(
+        incoming=True,
+        func=lambda e: _has_file(e) and is_chat_allowed(e)
+    ))
+    async def media_handler(event: Message) -> None:
+        """Handle incoming messages that carry a downloadable file."""
+        if event.message.fwd_from:
+            _log_forward(event)
+        await _download_from_message(bot, event, download_manager)
 
-        # Enhanced logging for forwarded messages
+    @bot.on(events.NewMessage(
+        incoming=True,
+        func=lambda e: not _has_file(e) and is_chat_allowed(e)
+    ))
+    async def link_handler(event: Message) -> None:
+        """Handle incoming text messages with Telegram links."""
         if event.message.fwd_from:
-            fwd = event.message.fwd_from
-            fwd_source = getattr(fwd, 'from_id', None) or getattr(fwd, 'from_name', None)
-            logger.info(f"收到转发消息: fwd_from={fwd_source}, type={type(fwd_source)}")
+            _log_forward(event)
             if not event.media:
-                logger.warning(f"转发消息无媒体内容: text_preview='{event.raw_text[:20]}'")
-                await event.respond("⚠️ 该转发消息似乎没有携带媒体文件。这可能是 Telegram 的版权保护限制，或者转发时未包含附件。")
-
-        # Check for media content first.
-        # MessageMediaWebPage is a link preview attached to this message itself
-        # (e.g. when the user sends a t.me link as text) - it is not a file, so
-        # skip it and let the text-link branch below parse the actual link.
-        if event.media and not isinstance(event.media, MessageMediaWebPage):
-            await _download_from_message(bot, event, download_manager)
-            return
+                logger.warning("转发消息无媒体内容: text_preview='%s'", event.raw_text[:20])
+                await event.respond(_MSG_FWD_NO_MEDIA)
 
-        # Check for Telegram links
-        message_text = event.text
-        if message_text:
-            links = _extract_telegram_links(message_text)
-            if links:
-                await _process_links(bot, event, download_manager, links)
-                return
+        links = _extract_message_links(event.message)
+        if links:
+            await _process_links(bot, event, download_manager, links)
+
+
+def _has_file(event: Message) -> bool:
+    """Check whether a message carries a downloadable file.
+    
+    MessageMediaWebPage is a link preview attached to the message itself
+    (e.g. when the user sends a t.me link as text) - it is not a file, so
+    such messages go to the link handler, which parses the actual link.
+    
+    Args:
+        event: Message event
+        
+    Returns:
+        True if the message has non-webpage media
+    """
+    return event.media is not None and not isinstance(event.media, MessageMediaWebPage)
+
+
+def _log_forward(event: Message) -> None:
+    """Log the source of a forwarded message.
+    
+    Args:
+        event: Forwarded message event
+    """
+    fwd = event.message.fwd_from
+    fwd_source = getattr(fwd, 'from_id', None) or getattr(fwd, 'from_name', None)
+    logger.info("收到转发消息: fwd_from=%s, type=%s", fwd_source, type(fwd_source))
 
 
-def _extract_telegram_links(text: str) -> List[str]:
-    """Extract all Telegram links from text.
+def _extract_message_links(message: Message) -> List[str]:
+    """Extract Telegram links from the URL entities of a message.
+    
+    Telegram already marks URLs in message entities, so only those slices
+    (and the targets of text hyperlinks) are scanned instead of the full text.
     
     Args:
-        text: Message text to parse
+        message: Incoming message
         
     Returns:
-        List of found Telegram links
+        List of found Telegram links, in message order
     """
-    if not text:
+    if not message.entities:
         return []
-    # 正则匹配基本的 https://t.me/... 链接，并过滤末尾可能粘连的中文句号或括号等非URL字符
-    # 末尾可选捕获 ?comment=/?thread= 等查询串（评论/话题链接），否则会被截断丢失
-    pattern = r'https?://(?:t\.me|telegram\.me)/[a-zA-Z0-9_/%+-]+(?:\?[a-zA-Z0-9_=&]+)?'
-    return re.findall(pattern, text)
+    
+    links = []
+    for entity, text in message.get_entities_text((MessageEntityUrl, MessageEntityTextUrl)):
+        url = entity.url if isinstance(entity, MessageEntityTextUrl) else text
+        # An entity holds exactly one URL, so a prefix test replaces a scan;
+        # the regex then trims trailing characters Telegram included in the entity
+        if url.startswith(_TG_PREFIXES):
+            match = _TG_LINK_RE.match(url)
+            if match:
+                links.append(match.group())
+    return links
 
 
 async def _download_from_message(
@@ -97,27 +144,29 @@ async def _download_from_message(
         event: Message event with media
         download_manager: DownloadManager instance
     """
+    # Local prep happens before the status RPC: the ID goes into the first
+    # status message so it can already carry the cancel command, and the
+    # download call needs the status message ID, so nothing is left to overlap
+    download_id = download_manager.reserve_id()
+    filename = _extract_filename(event)
     try:
-        status_message = await event.respond("⏳ Starting download...")
+        status_message = await event.respond(_MSG_STARTING.format(download_id))
     except Exception as e:
-        logger.error(f"Failed to create status message: {e}")
+        logger.error("Failed to create status message: %s", e)
         return
     
     try:
-        filename = _extract_filename(event)
-        
-        download_id = await download_manager.download_telegram_file(
-            bot, event.message, event.chat_id, status_message.id, filename
+        await download_manager.download_telegram_file(
+            bot, event.message, event.chat_id, status_message.id, filename,
+            download_id=download_id
         )
-        
-        if download_id:
-            await _add_cancel_info(bot, event, status_message, download_id, download_manager)
 
     except Exception as e:
-        logger.error(f"Download error for user {event.sender_id}: {e}", exc_info=True)
+        logger.error("Download error for user %s: %r", event.sender_id, e)
+        logger.debug("Download error traceback", exc_info=True)
         await _safe_edit_message(
             bot, event.chat_id, status_message.id,
-            f"❌ Download failed: {e}"
+            _MSG_DL_FAIL.format(e)
         )
 
 
@@ -136,124 +185,150 @@ async def _process_links(
         links: List of Telegram links to process
     """
     multi = len(links) > 1
-    success_count = 0
-    fail_count = 0
 
+    # 每个链接单独创建状态消息，避免并发下载时进度互相覆盖；
+    # 先按顺序发出，保证状态消息顺序与链接顺序一致
+    status_ids: List[Optional[int]] = []
     for i, link in enumerate(links):
-        # 每个链接单独创建状态消息，避免并发下载时进度互相覆盖
         try:
             label = f" {i + 1}/{len(links)}" if multi else ""
-            status_message = await event.respond(f"⏳ Processing link{label}...\n{link}")
+            status_message = await event.respond(_MSG_LINK.format(label, link))
+            status_ids.append(status_message.id)
         except Exception as e:
-            logger.error(f"Failed to create status message: {e}")
-            fail_count += 1
-            continue
+            logger.error("Failed to create status message: %s", e)
+            status_ids.append(None)
 
-        try:
-            download_id = await download_manager.process_telegram_link(
-                bot, link, event.chat_id, status_message.id
-            )
-            if download_id:
-                success_count += 1
-            else:
-                fail_count += 1
-                # 双客户端模式：@bot 下载失败 → 提供「用老号重试」按钮
-                if download_manager.fallback_client is not None:
-                    token = download_manager.register_retry(link, event.chat_id, status_message.id)
-                    try:
-                        await bot.edit_message(
-                            event.chat_id, status_message.id,
-                            f"❌ @bot 无法下载该链接（可能是禁止转发/私有频道）。\n{link}\n\n"
-                            f"👇 点下方用老号重试：",
-                            buttons=[Button.inline("🔁 用老号重试", f"userretry_{token}".encode())]
-                        )
-                    except Exception as e:
-                        logger.warning(f"挂重试按钮失败: {e}")
-        except Exception as e:
-            logger.error(f"Link processing error for user {event.sender_id} on {link}: {e}", exc_info=True)
-            fail_count += 1
-            await _safe_edit_message(
-                bot, event.chat_id, status_message.id,
-                f"❌ Error processing link ({i + 1}): {e}\n{link}"
-            )
+    # process_telegram_link() waits for the whole download, so links in a batch
+    # run side by side (bounded) instead of one after another
+    semaphore = asyncio.Semaphore(_LINK_CONCURRENCY)
+
+    async def process(index: int, link: str, status_msg_id: int) -> bool:
+        async with semaphore:
+            return await _process_link(bot, event, download_manager, link, index, status_msg_id)
+
+    results = await asyncio.gather(*(
+        process(i, link, status_msg_id)
+        for i, (link, status_msg_id) in enumerate(zip(links, status_ids))
+        if status_msg_id is not None
+    ))
+    success_count = sum(results)
+    fail_count = len(links) - success_count
 
     if multi:
-        await event.respond(
-            f"✅ Batch processing complete!\n"
-            f"Successfully added: {success_count}\n"
-            f"Failed: {fail_count}"
-        )
+        await event.respond(_MSG_BATCH_DONE.format(success_count, fail_count))
 
 
-def _extract_filename(event: Message) -> str:
-    """Extract filename from message media.
+async def _process_link(
+    bot,
+    event: Message,
+    download_manager: DownloadManager,
+    link: str,
+    index: int,
+    status_msg_id: int
+) -> bool:
+    """Process a single Telegram link for download.
     
     Args:
-        event: Message event with media
+        bot: Telethon client
+        event: Message event
+        download_manager: DownloadManager instance
+        link: Telegram link to process
+        index: Position of the link in the message (0-based)
+        status_msg_id: Status message ID for this link
         
     Returns:
-        Extracted or generated filename
+        True if the download was started or queued, False otherwise
     """
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    
-    # Check if it's a photo
-    if isinstance(event.media, MessageMediaPhoto):
-        return f"photo_{timestamp}.jpg"
-    
-    # Check for document with filename attribute
-    if hasattr(event.media, 'document') and event.media.document:
-        for attribute in event.media.document.attributes:
-            if isinstance(attribute, DocumentAttributeFilename) and attribute.file_name:
-                return attribute.file_name
+    try:
+        download_id = await download_manager.process_telegram_link(
+            bot, link, event.chat_id, status_msg_id
+        )
+        if download_id:
+            return True
+
+        # 双客户端模式：@bot 下载失败 → 提供「用老号重试」按钮（队列已满时换号也无济于事）
+        if download_manager.fallback_client is not None and not download_manager.is_queue_full():
+            token = download_manager.register_retry(link, event.chat_id, status_msg_id)
+            try:
+                await bot.edit_message(
+                    event.chat_id, status_msg_id,
+                    _MSG_LINK_RETRY.format(link),
+                    buttons=[Button.inline("🔁 用老号重试", b"userretry_" + token.encode())]
+                )
+            except MessageNotModifiedError:
+                pass
+            except Exception as e:
+                logger.warning("挂重试按钮失败: %s", e)
+    except Exception as e:
+        logger.error("Link processing error for user %s on %s: %r", event.sender_id, link, e)
+        logger.debug("Link processing error traceback", exc_info=True)
+        await _safe_edit_message(
+            bot, event.chat_id, status_msg_id,
+            _MSG_LINK_FAIL.format(index + 1, e, link)
+        )
+    return False
+
+
+def _timestamp() -> str:
+    """Return the local time as YYYYMMDDHHMMSS, formatted once per second.
     
-    return f"file_{timestamp}"
+    Returns:
+        Timestamp string for generated filenames
+    """
+    now = int(time.time())
+    if now != _timestamp_cache[0]:
+        _timestamp_cache[0] = now
+        _timestamp_cache[1] = time.strftime('%Y%m%d%H%M%S', time.localtime(now))
+    return _timestamp_cache[1]
 
 
-async def _add_cancel_info(
-    bot,
-    event: Message,
-    status_message: Message,
-    download_id: str,
-    download_manager: DownloadManager
-) -> None:
-    """Add cancellation info to the status message if download is still active.
+def _extract_filename(event: Message) -> str:
+    """Extract filename from message media.
     
     Args:
-        bot: Telethon client
-        event: Original message event
-        status_message: Status message to update
-        download_id: Download ID
-        download_manager: DownloadManager instance
+        event: Message event with media
+        
+    Returns:
+        Extracted or generated filename
     """
-    active_downloads = download_manager.list_active_downloads()
-    queued_downloads = download_manager.list_queued_downloads()
+    # The clock is only read for the generated names, not for named documents
+    if isinstance(event.media, MessageMediaPhoto):
+        return f"photo_{_timestamp()}.jpg"
     
-    is_active = download_id in active_downloads
-    is_queued = any(q['download_id'] == download_id for q in queued_downloads)
+    # Telethon's File.name reads the document's DocumentAttributeFilename
+    name = getattr(event.file, 'name', None)
+    if name:
+        return name
     
-    if is_active or is_queued:
-        try:
-            current_message = await bot.get_messages(event.chat_id, ids=status_message.id)
-            if current_message and current_message.text:
-                await bot.edit_message(
-                    event.chat_id,
-                    status_message.id,
-                    f"{current_message.text}\n\nTo cancel: `/cancel {download_id}`"
-                )
-        except Exception as e:
-            logger.warning(f"Could not add cancellation info: {e}")
+    return f"file_{_timestamp()}"
 
 
 async def _safe_edit_message(bot, chat_id: int, msg_id: int, text: str) -> None:
     """Safely edit a message, handling errors gracefully.
     
+    Unchanged text is ignored silently; a flood wait is slept through and
+    the edit retried once.
+    
     Args:
         bot: Telethon client
         chat_id: Chat ID
         msg_id: Message ID
         text: New message text
     """
-    try:
-        await bot.edit_message(chat_id, msg_id, text)
-    except Exception as e:
-        logger.warning(f"Failed to edit message: {e}")
+    for attempt in range(2):  # 首次 + FloodWait 后重试 1 次
+        try:
+            await bot.edit_message(chat_id, msg_id, text)
+            return
+        except MessageNotModifiedError:
+            return
+        except FloodWaitError as e:
+            if attempt == 1:
+                logger.warning("Failed to edit message after flood wait: %s", e)
+                return
+            await asyncio.sleep(e.seconds)
+        except RPCError as e:
+            logger.warning("Failed to edit message: %s", e)
+            return
+        except Exception as e:
+            logger.warning("Failed to edit message: %r", e)
+            return
@@ -1,13 +1,15 @@
 """Utility modules for the Telegram File Bot."""
 
-from .helpers import format_size, format_time, sanitize_filename
+from .helpers import format_size, format_time, sanitize_filename, TokenBucket
 from .download_manager import DownloadManager
-from .file_manager import FileManager
+from .file_manager import FileManager, FileInfo
 
 __all__ = [
     'format_size',
     'format_time',
     'sanitize_filename',
+    'TokenBucket',
     'DownloadManager',
     'FileManager',
+    'FileInfo',
 ]
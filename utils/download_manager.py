@@ -2,15 +2,17 @@
 
 import os
 import asyncio
+import heapq
 import time
 import logging
 import uuid
 import re
 import shutil
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set, Tuple, Callable, Awaitable
 from dataclasses import dataclass, field
-from collections import deque
+from collections import deque, OrderedDict
+from itertools import islice
 
 from telethon import TelegramClient
 from telethon.tl.types import Message, MessageMediaDocument, MessageMediaPhoto, PeerChannel
@@ -18,14 +20,37 @@ from telethon.errors import FloodWaitError
 from telethon.tl.functions.messages import GetDiscussionMessageRequest
 
 import config
-from .helpers import format_size, format_time, sanitize_filename
+from .helpers import format_size, format_time, sanitize_filename, TokenBucket
 
 logger = logging.getLogger(__name__)
 
+# 下载写盘缓冲区大小：Telethon 每次写入 128-512 KB 的分块，1 MiB 缓冲可把多个分块合并为一次 write
+_WRITE_BUFFER_SIZE = 1024 * 1024
 
-@dataclass
+# 占用并发槽位的状态 / 可被清理的终态
+_ACTIVE_STATUSES = frozenset({'downloading', 'waiting'})
+_FINISHED_STATUSES = frozenset({'completed', 'failed', 'cancelled'})
+
+# 已结束的下载记录保留多久（秒）后可被清理；cancelled 立即可清理
+_FINISHED_RETENTION = 30
+
+# 进度条：按已填充格数预先生成全部 21 种形态
+_BAR_LENGTH = 20
+_BAR_TABLE = tuple('█' * i + '░' * (_BAR_LENGTH - i) for i in range(_BAR_LENGTH + 1))
+
+# 本地记住最近这么多条状态消息的当前文本，相同文本的编辑不再请求 Telegram
+_EDIT_CACHE_SIZE = 512
+
+# 出队时只刷新队首这么多项的排队位置，其余项的实时位置用 /queue 查看
+_POSITION_UPDATE_LIMIT = 3
+
+# 帖子链接解析：t.me/<频道>/<消息ID>、t.me/c/<私有频道ID>/<消息ID>，可带 ?comment=<评论ID>
+_TG_LINK_RE = re.compile(r't\.me/(c/)?([a-zA-Z0-9_]+)/(\d+)(?:\?comment=(\d+))?')
+
+
+@dataclass(slots=True)
 class DownloadInfo:
-    """Information about an active or queued download."""
+    """Information about an active or queued download (slotted: finished records linger)."""
     download_id: str
     filename: str
     path: str
@@ -34,22 +59,28 @@ class DownloadInfo:
     downloaded: int = 0
     speed: float = 0
     status: str = 'pending'  # pending, downloading, completed, failed, cancelled, waiting
-    start_time: float = field(default_factory=time.time)
-    last_update_time: float = field(default_factory=time.time)
+    # 以下时间戳均取自 time.monotonic()，只用于计算时间差
+    start_time: float = field(default_factory=time.monotonic)
+    last_update_time: float = field(default_factory=time.monotonic)
     last_downloaded: int = 0
-    last_message: str = ''
+    last_message_hash: int = 0  # hash of the last progress text sent
     task: Optional[asyncio.Task] = None
     initial_phase: bool = True
     rate_limited: bool = False
-    last_edit_time: float = field(default_factory=time.time)
+    last_edit_time: float = field(default_factory=time.monotonic)
+    # 进入终态时置位，让进度更新任务立即退出
+    done_event: asyncio.Event = field(default_factory=asyncio.Event)
     chat_id: int = 0
     status_msg_id: int = 0
     message: Optional[Message] = None
+    # 进度消息中每次都相同的部分，算一次后复用
+    size_str: str = ''
+    progress_header: str = ''
 
 
-@dataclass
+@dataclass(slots=True)
 class QueuedDownload:
-    """A download waiting in the queue."""
+    """A download waiting in the queue (slotted: the queue can hold many)."""
     download_id: str
     client: TelegramClient
     message: Message
@@ -57,6 +88,137 @@ class QueuedDownload:
     status_msg_id: int
     filename: str
     added_time: float = field(default_factory=time.time)
+    # 调用方在等待结果时设置（立即开始的下载），由 worker 回填 _start_download 的返回值
+    result: Optional[asyncio.Future] = None
+
+
+# 元数据类的短系统调用（stat/exists/makedirs）直接在事件循环中同步执行：
+# 它们只需数微秒，切换到线程池的开销反而更大，且调用次数已由 _known_dirs、
+# scandir 集合等缓存压到每次下载一两次。只有可能真正耗时的操作
+# （删除大文件、可能被 glibc 模拟的预分配、目录遍历）才放进线程。
+def _file_size(path: str) -> int:
+    """Return the size of a file, or 0 if it cannot be stat'ed."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _preallocate(fd: int, size: int) -> bool:
+    """Reserve disk space for a download so its blocks are allocated in one go.
+
+    Args:
+        fd: File descriptor of the freshly created target file
+        size: Expected file size in bytes
+
+    Returns:
+        True if the space was reserved
+    """
+    if not config.PREALLOCATE_DOWNLOADS or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    except OSError as e:
+        # 空间不足时交由下载本身报错；文件系统不支持时照常下载
+        logger.debug(f"Preallocation of {size} bytes failed: {e}")
+        return False
+
+
+def _make_progress_callback(info: DownloadInfo) -> Callable[[int, int], None]:
+    """Build a Telethon progress callback that updates ``info`` in place.
+
+    The record is bound once per download, so each chunk only touches locals
+    instead of looking the download up in active_downloads.
+
+    Args:
+        info: Record of the download being tracked
+
+    Returns:
+        Callback taking (downloaded, total) byte counts
+    """
+    def progress_callback(downloaded: int, total: int) -> None:
+        if info.status == 'cancelled':
+            return
+        
+        # Determine if update is significant
+        if info.downloaded < 1024 * 1024:  # First 1MB
+            significant = True
+        else:
+            min_progress = min(256 * 1024, (total or 1) * 0.01)
+            significant = abs(downloaded - info.last_downloaded) >= min_progress
+        
+        if total and downloaded == total:
+            significant = True
+        
+        if significant:
+            info.downloaded = downloaded
+            if total and total > 0 and total != info.size:
+                info.size = total
+                info.size_str = format_size(total)
+            
+            # 当开始收到数据时，退出初始化阶段
+            if info.initial_phase and downloaded > 0:
+                info.initial_phase = False
+            
+            current_time = time.monotonic()
+            elapsed = current_time - info.last_update_time
+            if elapsed >= 0.1:
+                downloaded_since = downloaded - info.last_downloaded
+                if elapsed > 0:
+                    info.speed = downloaded_since / elapsed
+                info.last_update_time = current_time
+                info.last_downloaded = downloaded
+    
+    return progress_callback
+
+
+class EditCoalescer:
+    """Collapses bursts of edits to the same message into one edit.
+    
+    Scheduled edits are held for a short window per (chat_id, msg_id); later
+    edits in the window replace the pending text, and only the newest text is
+    sent when the window closes.
+    """
+    
+    def __init__(
+        self,
+        send: Callable[[TelegramClient, int, int, str], Awaitable[Any]],
+        delay: float = 0.25
+    ):
+        self._send = send
+        self._delay = delay
+        self._pending: Dict[Tuple[int, int], Tuple[TelegramClient, str]] = {}
+        self._timers: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def schedule(self, client: TelegramClient, chat_id: int, msg_id: int, text: str) -> None:
+        """Queue an edit, replacing any edit still pending for the message."""
+        key = (chat_id, msg_id)
+        self._pending[key] = (client, text)
+        if key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(
+                self._delay, self._flush, key
+            )
+    
+    def discard(self, chat_id: int, msg_id: int) -> None:
+        """Drop a pending edit so it cannot overwrite a newer direct edit."""
+        key = (chat_id, msg_id)
+        self._pending.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+    
+    def _flush(self, key: Tuple[int, int]) -> None:
+        """Send the newest pending text for a message."""
+        self._timers.pop(key, None)
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        client, text = pending
+        task = asyncio.create_task(self._send(client, key[0], key[1], text))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
 
 
 class DownloadManager:
@@ -64,14 +226,37 @@ class DownloadManager:
     
     def __init__(self):
         self.active_downloads: Dict[str, DownloadInfo] = {}
+        # active_downloads 的按状态索引（dict 充当有序集合，保持登记顺序）；
+        # 仅经 _track_download/_set_status/_untrack_download 维护
+        self._active_ids: Dict[str, None] = {}
+        self._finished_ids: Dict[str, None] = {}
+        # 终态记录的到期小顶堆 (expire_time, download_id)，清理时只弹出已到期的项
+        self._expiry: List[Tuple[float, str]] = []
         self.download_queue: deque[QueuedDownload] = deque()
+        # IDs in download_queue, kept in step with it for O(1) is_queued()
+        self._queued_ids: Set[str] = set()
         self.update_interval = 3
         self.max_concurrent_downloads = max(1, config.MAX_CONCURRENT_DOWNLOADS)
         self.max_retries = max(1, config.MAX_RETRIES)
-        self.last_global_update: float = 0
+        # 排队项持有 client/Message 引用，限制队列长度以免内存无界增长
+        self.max_queue_size = max(1, config.MAX_QUEUE_SIZE)
         self.global_update_interval = 1
-        self._queue_processor_task: Optional[asyncio.Task] = None
-        self._lock = asyncio.Lock()
+        # 所有状态/进度编辑共用的令牌桶：每个间隔放行 1 次编辑，超出的编辑排队等待令牌
+        self._edit_bucket = TokenBucket(1, self.global_update_interval)
+        # 待执行下载的工作队列，由 max_concurrent_downloads 个常驻 worker 消费；
+        # worker 数即并发上限。download_queue 仍保留顺序，供 /queue 展示与取消
+        self._pending: asyncio.Queue[QueuedDownload] = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        # 正在执行（或已为立即下载预留）的 worker 数，由 _worker 在 _start_download 前后维护；
+        # 下载记录在完成消息发出前就已离开 _active_ids，不能据此判断 worker 是否空闲
+        self._busy_workers = 0
+        # 已确认存在的日期目录，避免每次下载都 makedirs
+        self._known_dirs: Set[str] = set()
+        # 排队位置等高频状态编辑经此合并，只发送窗口内最新的文本
+        # 合并器直接调用 _do_edit：经 _safe_edit_message 会丢弃发送前刚排入的更新文本
+        self._edit_coalescer = EditCoalescer(self._do_edit)
+        # (chat_id, msg_id) -> 最近一次成功编辑的文本，按最近使用排序（LRU）
+        self._edit_cache: OrderedDict[Tuple[int, int], str] = OrderedDict()
 
         # 双客户端：messaging_client 恒为主客户端(发/改消息)，fallback_client 为老号(回退下载)
         self.messaging_client: Optional[TelegramClient] = None
@@ -84,7 +269,7 @@ class DownloadManager:
         # 启动时扫描残留的 .downloading 文件
         self._scan_residual_downloading_files()
     
-    async def _get_unique_filepath(self, directory: str, filename: str) -> str:
+    def _get_unique_filepath(self, directory: str, filename: str) -> str:
         """Generate a unique filename to avoid overwriting existing files.
         
         Args:
@@ -99,14 +284,25 @@ class DownloadManager:
         if not os.path.exists(original_filepath):
             return original_filepath
         
+        # 名称冲突时一次性列出目录，之后的序号探测只查内存集合，不再逐个 stat
+        try:
+            with os.scandir(directory) as it:
+                existing: Optional[Set[str]] = {entry.name for entry in it}
+        except OSError:
+            existing = None  # 无法列目录时退回逐个 exists 检查
+        
         name, ext = os.path.splitext(filename)
         counter = 1
         
         while True:
             new_filename = f"{name} ({counter}){ext}"
+            
             new_filepath = os.path.join(directory, new_filename)
             
-            if not os.path.exists(new_filepath):
+            if existing is None:
+                if not os.path.exists(new_filepath):
+                    return new_filepath
+            elif new_filename not in existing:
                 return new_filepath
             
             counter += 1
@@ -134,8 +330,37 @@ class DownloadManager:
 
     def _get_active_count(self) -> int:
         """Get count of actively downloading items."""
-        return sum(1 for d in self.active_downloads.values() 
-                   if d.status in ('downloading', 'waiting'))
+        return len(self._active_ids)
+    
+    def _track_download(self, info: DownloadInfo) -> None:
+        """Register a download record and index it by its status."""
+        self.active_downloads[info.download_id] = info
+        self._set_status(info, info.status)
+    
+    def _set_status(self, info: DownloadInfo, status: str) -> None:
+        """Change a download's status and keep the status indexes in step."""
+        info.status = status
+        download_id = info.download_id
+        if status in _ACTIVE_STATUSES:
+            self._active_ids[download_id] = None
+            self._finished_ids.pop(download_id, None)
+        elif status in _FINISHED_STATUSES:
+            self._finished_ids[download_id] = None
+            self._active_ids.pop(download_id, None)
+            expire_time = time.time()
+            if status != 'cancelled':
+                expire_time += _FINISHED_RETENTION
+            heapq.heappush(self._expiry, (expire_time, download_id))
+            info.done_event.set()
+        else:
+            self._active_ids.pop(download_id, None)
+            self._finished_ids.pop(download_id, None)
+    
+    def _untrack_download(self, download_id: str) -> None:
+        """Remove a download record and its index entries."""
+        self.active_downloads.pop(download_id, None)
+        self._active_ids.pop(download_id, None)
+        self._finished_ids.pop(download_id, None)
     
     async def download_telegram_file(
         self,
@@ -143,7 +368,8 @@ class DownloadManager:
         message: Message,
         chat_id: int,
         status_msg_id: int,
-        filename: str
+        filename: str,
+        download_id: Optional[str] = None
     ) -> Optional[str]:
         """Download a file from a Telegram message.
         
@@ -153,47 +379,135 @@ class DownloadManager:
             chat_id: Chat ID for status updates
             status_msg_id: Message ID for status updates
             filename: Desired filename
+            download_id: ID chosen by the caller (e.g. already shown to the user);
+                generated when omitted
             
         Returns:
-            Download ID if started/queued, None on failure
+            Download ID if started/queued, None on failure or when the queue is full
         """
         self._cleanup_completed_downloads()
         
-        download_id = str(uuid.uuid4())[:8]
-        
-        # Check if we can start immediately or need to queue
-        if self._get_active_count() >= self.max_concurrent_downloads:
-            # Add to queue
-            queued = QueuedDownload(
-                download_id=download_id,
-                client=client,
-                message=message,
-                chat_id=chat_id,
-                status_msg_id=status_msg_id,
-                filename=filename
-            )
-            self.download_queue.append(queued)
-            
-            queue_position = len(self.download_queue)
+        if self.is_queue_full():
             await self._safe_edit_message(
                 client, chat_id, status_msg_id,
-                f"📋 **Queued for Download**\n\n"
+                f"❌ **Queue Full**\n\n"
                 f"**File:** `{filename}`\n"
-                f"**Position:** #{queue_position}\n"
-                f"**Download ID:** `{download_id}`\n\n"
-                f"Download will start automatically when a slot is available.\n"
-                f"To cancel: `/cancel {download_id}`"
+                f"{len(self.download_queue)} downloads are already waiting. "
+                f"Please try again later."
             )
-            
-            # Start queue processor if not running
-            if self._queue_processor_task is None or self._queue_processor_task.done():
-                self._queue_processor_task = asyncio.create_task(self._process_queue())
-            
-            logger.info(f"Download queued: {filename}, ID: {download_id}, position: {queue_position}")
-            return download_id
+            logger.warning(f"Download rejected, queue full: {filename}")
+            return None
         
-        # Start download immediately
-        return await self._start_download(client, message, chat_id, status_msg_id, filename, download_id)
+        if download_id is None:
+            download_id = self.reserve_id()
+        
+        self._ensure_workers()
+        
+        # 有空闲 worker 且无人排队时等待下载完成，调用方据返回值判断成败（如提供「用老号重试」）；
+        # 否则排队后立即返回
+        start_now = (
+            not self.download_queue and self._busy_workers < self.max_concurrent_downloads
+        )
+        queued = QueuedDownload(
+            download_id=download_id,
+            client=client,
+            message=message,
+            chat_id=chat_id,
+            status_msg_id=status_msg_id,
+            filename=filename,
+            result=asyncio.get_running_loop().create_future() if start_now else None
+        )
+        
+        if start_now:
+            # 当场预留一个 worker；不进入 download_queue，不出现在 /queue 中，也不占队列容量
+            self._busy_workers += 1
+            self._pending.put_nowait(queued)
+            return await queued.result
+        
+        self.download_queue.append(queued)
+        self._queued_ids.add(download_id)
+        queue_position = len(self.download_queue)
+        await self._safe_edit_message(
+            client, chat_id, status_msg_id,
+            f"📋 **Queued for Download**\n\n"
+            f"**File:** `{filename}`\n"
+            f"**Position:** #{queue_position}\n"
+            f"**Download ID:** `{download_id}`\n\n"
+            f"Download will start automatically when a slot is available.\n"
+            f"Current position: /queue\n"
+            f"To cancel: `/cancel {download_id}`"
+        )
+        # 排队提示发出后才交给 worker，避免其覆盖随后开始下载时的进度消息
+        self._pending.put_nowait(queued)
+        
+        logger.info(f"Download queued: {filename}, ID: {download_id}, position: {queue_position}")
+        return download_id
+    
+    def _ensure_workers(self) -> None:
+        """Start the download workers on first use (needs a running event loop)."""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.max_concurrent_downloads)
+        ]
+    
+    async def _worker(self) -> None:
+        """Long-running consumer: take downloads from the queue one at a time."""
+        while True:
+            queued = await self._pending.get()
+            try:
+                if queued.result is None:
+                    # 排队的下载：立即下载已在入口处预留了 worker
+                    if queued.download_id not in self._queued_ids:
+                        # 排队期间已被取消
+                        continue
+                    self._queued_ids.discard(queued.download_id)
+                    if self.download_queue and self.download_queue[0] is queued:
+                        self.download_queue.popleft()
+                    else:
+                        self.download_queue.remove(queued)
+                    self._busy_workers += 1
+                    self._announce_queue_positions()
+                
+                try:
+                    result = await self._start_download(
+                        queued.client,
+                        queued.message,
+                        queued.chat_id,
+                        queued.status_msg_id,
+                        queued.filename,
+                        queued.download_id
+                    )
+                except Exception as e:
+                    logger.error(f"Download worker error for {queued.download_id}: {e}", exc_info=True)
+                    result = None
+                finally:
+                    # 完成消息、失败提示与临时文件清理都在 _start_download 内，结束后 worker 才算空闲
+                    self._busy_workers -= 1
+                if queued.result is not None and not queued.result.done():
+                    queued.result.set_result(result)
+                # _start_download 把 CancelledError 当作用户取消吞掉；close() 取消 worker 时仍须退出
+                if asyncio.current_task().cancelling():
+                    raise asyncio.CancelledError
+            finally:
+                if queued.result is not None and not queued.result.done():
+                    # 下载被关闭打断，不让调用方永远等待
+                    queued.result.cancel()
+                self._pending.task_done()
+    
+    async def close(self) -> None:
+        """Cancel the download workers and wait for them to exit (call on shutdown)."""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # 尚未被 worker 取走的立即下载，同样不让调用方永远等待
+        while not self._pending.empty():
+            queued = self._pending.get_nowait()
+            if queued.result is not None and not queued.result.done():
+                queued.result.cancel()
+            self._pending.task_done()
     
     async def _start_download(
         self,
@@ -210,7 +524,9 @@ class DownloadManager:
 
         today = datetime.now().strftime('%Y%m%d')
         download_path = os.path.join(config.DOWNLOAD_PATH, today)
-        os.makedirs(download_path, exist_ok=True)
+        if download_path not in self._known_dirs:
+            os.makedirs(download_path, exist_ok=True)
+            self._known_dirs.add(download_path)
 
         # 生成下载中文件名：{原文件名}.{download_id}.downloading
         temp_filename = f"{filename}.{download_id}.downloading"
@@ -226,11 +542,11 @@ class DownloadManager:
             status='downloading',
             chat_id=chat_id,
             status_msg_id=status_msg_id,
-            message=message
+            message=message,
+            progress_header=f"⏬ Downloading: `{filename}`\n"
         )
-        # 立即登记占位：使 _get_active_count() 即时计入本任务，闭合
-        # 「检查并发数 → 登记」之间的竞态（到这里为止无 await）
-        self.active_downloads[key] = download_info
+        # 立即登记占位：在第一个 await 之前，/active 与 /cancel 即可看到本任务
+        self._track_download(download_info)
 
         # 刷新消息对象，获取最新的 file_reference，防止长时间闲置后过期
         try:
@@ -249,7 +565,7 @@ class DownloadManager:
         if not isinstance(message.media, (MessageMediaDocument, MessageMediaPhoto)):
             media_type = type(message.media).__name__
             logger.warning(f"不支持的媒体类型 {media_type}，跳过下载: {filename}")
-            del self.active_downloads[key]
+            self._untrack_download(key)
             await self._safe_edit_message(
                 client, chat_id, status_msg_id,
                 f"⚠️ **无法下载**\n\n"
@@ -278,11 +594,11 @@ class DownloadManager:
             if result and key in self.active_downloads:
                 info = self.active_downloads[key]
                 if info.status != 'cancelled':
-                    file_size = os.path.getsize(result) if os.path.exists(result) else 0
+                    file_size = _file_size(result)
 
                     # 去掉 .downloading 后缀，调用 _get_unique_filepath() 生成最终文件名
                     base_name = filename
-                    final_path = await self._get_unique_filepath(download_path, base_name)
+                    final_path = self._get_unique_filepath(download_path, base_name)
                     final_filename = os.path.basename(final_path)
                     final_relative = os.path.relpath(final_path, config.DOWNLOAD_PATH)
 
@@ -295,7 +611,7 @@ class DownloadManager:
                     info.filename = final_filename
                     info.path = final_path
                     info.relative_path = final_relative
-                    info.status = 'completed'
+                    self._set_status(info, 'completed')
                     info.size = file_size
                     info.downloaded = file_size
 
@@ -317,14 +633,14 @@ class DownloadManager:
                 client, chat_id, status_msg_id,
                 f"🛑 Download cancelled: `{filename}`"
             )
-            self._cleanup_partial_file(file_path)
+            await self._cleanup_partial_file(file_path)
             return None
             
         except Exception as e:
             logger.error(f"Download error: {e}", exc_info=True)
             if key in self.active_downloads:
-                self.active_downloads[key].status = 'failed'
-            self._cleanup_partial_file(file_path)
+                self._set_status(self.active_downloads[key], 'failed')
+            await self._cleanup_partial_file(file_path)
             await self._safe_edit_message(
                 client, chat_id, status_msg_id,
                 f"❌ Download failed: {str(e)}"
@@ -335,8 +651,6 @@ class DownloadManager:
             update_task.cancel()
             # Schedule cleanup
             asyncio.create_task(self._delayed_cleanup(key, 5))
-            # Process queue after download completes
-            asyncio.create_task(self._process_queue())
     
     async def _download_with_retry(
         self,
@@ -356,6 +670,8 @@ class DownloadManager:
         Returns:
             Downloaded file path or None
         """
+        info = self.active_downloads.get(download_id)
+        progress_callback = _make_progress_callback(info) if info is not None else None
         for attempt in range(self.max_retries):
             try:
                 # 非首次重试时，仅刷新 file_reference（绝不断开共享连接！）
@@ -370,11 +686,7 @@ class DownloadManager:
                         logger.warning(f"重试前刷新消息失败: {ref_err}")
 
                 download_task = asyncio.create_task(
-                    client.download_media(
-                        message,
-                        file_path,
-                        progress_callback=lambda d, t: self._progress_callback(d, t, download_id)
-                    )
+                    self._download_to_file(client, message, file_path, progress_callback)
                 )
                 
                 if download_id in self.active_downloads:
@@ -414,7 +726,7 @@ class DownloadManager:
                 
                 if download_id in self.active_downloads:
                     info = self.active_downloads[download_id]
-                    info.status = 'waiting'
+                    self._set_status(info, 'waiting')
                     await self._safe_edit_message(
                         client, info.chat_id, info.status_msg_id,
                         f"⏳ Rate limited. Waiting {wait_time} seconds...\n"
@@ -439,37 +751,61 @@ class DownloadManager:
         
         return None
     
-    async def _process_queue(self) -> None:
-        """Process queued downloads when slots become available."""
-        async with self._lock:
-            while self.download_queue and self._get_active_count() < self.max_concurrent_downloads:
-                queued = self.download_queue.popleft()
-                
-                # Update queue positions for remaining items
-                for i, item in enumerate(self.download_queue):
-                    try:
-                        await self._safe_edit_message(
-                            item.client, item.chat_id, item.status_msg_id,
-                            f"📋 **Queued for Download**\n\n"
-                            f"**File:** `{item.filename}`\n"
-                            f"**Position:** #{i + 1}\n"
-                            f"**Download ID:** `{item.download_id}`\n\n"
-                            f"To cancel: `/cancel {item.download_id}`"
-                        )
-                    except Exception:
-                        pass
-                
-                # Start the queued download
-                asyncio.create_task(
-                    self._start_download(
-                        queued.client,
-                        queued.message,
-                        queued.chat_id,
-                        queued.status_msg_id,
-                        queued.filename,
-                        queued.download_id
-                    )
-                )
+    async def _download_to_file(
+        self,
+        client: TelegramClient,
+        message: Message,
+        file_path: str,
+        progress_callback: Optional[Callable[[int, int], None]]
+    ) -> Optional[str]:
+        """通过大缓冲区文件对象下载媒体，减少写盘系统调用次数。
+        
+        Args:
+            client: Telethon client
+            message: Message with file
+            file_path: Target file path
+            progress_callback: Progress callback for the tracked download, if any
+            
+        Returns:
+            file_path on success, None if the message has nothing to download
+        """
+        try:
+            f = open(file_path, 'wb', buffering=_WRITE_BUFFER_SIZE)
+        except FileNotFoundError:
+            # 日期目录可能已被删除文件后的空目录清理移除（_known_dirs 已过期）
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            f = open(file_path, 'wb', buffering=_WRITE_BUFFER_SIZE)
+        with f:
+            size = getattr(message.file, 'size', None)
+            preallocated = bool(size) and await asyncio.to_thread(_preallocate, f.fileno(), size)
+            result = await client.download_media(
+                message,
+                f,
+                progress_callback=progress_callback
+            )
+            if preallocated and result is f:
+                # 实际大小与声明不符时，截掉预分配多出的部分（truncate 会先刷新缓冲区）
+                f.truncate()
+        # 传入文件对象时 download_media 返回该对象本身，映射回路径以保持调用方语义
+        return file_path if result is f else result
+    
+    def _announce_queue_positions(self) -> None:
+        """Update queue positions for the items now at the head of the queue.
+
+        Only the first _POSITION_UPDATE_LIMIT items are edited, so a completion
+        costs a bounded number of edits instead of one per queued item. When
+        several slots free up at once, each item is only edited with its final
+        position.
+        """
+        for i, item in enumerate(islice(self.download_queue, _POSITION_UPDATE_LIMIT)):
+            self._edit_coalescer.schedule(
+                item.client, item.chat_id, item.status_msg_id,
+                f"📋 **Queued for Download**\n\n"
+                f"**File:** `{item.filename}`\n"
+                f"**Position:** #{i + 1}\n"
+                f"**Download ID:** `{item.download_id}`\n\n"
+                f"To cancel: `/cancel {item.download_id}`"
+            )
     
     def cancel_download(self, download_id: str) -> Dict[str, Any]:
         """Cancel an active or queued download.
@@ -487,10 +823,11 @@ class DownloadManager:
             if info.task and not info.task.done():
                 info.task.cancel()
             
-            info.status = 'cancelled'
-            self._cleanup_partial_file(info.path)
+            self._set_status(info, 'cancelled')
+            # 同步接口内不等待删除结果，交给线程池执行
+            asyncio.get_running_loop().run_in_executor(None, self._remove_partial_file, info.path)
             
-            del self.active_downloads[download_id]
+            self._untrack_download(download_id)
             logger.info(f"Cancelled active download: {download_id}")
             
             return {
@@ -500,17 +837,19 @@ class DownloadManager:
             }
         
         # Check queue
-        for queued in list(self.download_queue):
-            if queued.download_id == download_id:
-                self.download_queue.remove(queued)
-                logger.info(f"Cancelled queued download: {download_id}")
-                
-                return {
-                    'success': True,
-                    'filename': queued.filename,
-                    'download_id': download_id,
-                    'was_queued': True
-                }
+        if self.is_queued(download_id):
+            for queued in self.download_queue:
+                if queued.download_id == download_id:
+                    self.download_queue.remove(queued)
+                    self._queued_ids.discard(download_id)
+                    logger.info(f"Cancelled queued download: {download_id}")
+                    
+                    return {
+                        'success': True,
+                        'filename': queued.filename,
+                        'download_id': download_id,
+                        'was_queued': True
+                    }
         
         return {
             'success': False,
@@ -556,6 +895,50 @@ class DownloadManager:
         )
         return True
 
+    def reserve_id(self) -> str:
+        """Pick a new download ID before the download is submitted.
+        
+        Lets callers show the ID (e.g. the cancel command) in their first
+        status message and then pass it to download_telegram_file().
+        
+        Returns:
+            Short ID not used by any active or queued download
+        """
+        while True:
+            download_id = str(uuid.uuid4())[:8]
+            if download_id not in self.active_downloads and download_id not in self._queued_ids:
+                return download_id
+    
+    def is_active(self, download_id: str) -> bool:
+        """Check whether a download is currently running.
+        
+        Args:
+            download_id: Download ID to check
+            
+        Returns:
+            True if the download is downloading or waiting to retry
+        """
+        return download_id in self._active_ids
+    
+    def is_queued(self, download_id: str) -> bool:
+        """Check whether a download is waiting in the queue.
+        
+        Args:
+            download_id: Download ID to check
+            
+        Returns:
+            True if the download is queued
+        """
+        return download_id in self._queued_ids
+    
+    def is_queue_full(self) -> bool:
+        """Check whether the queue has reached MAX_QUEUE_SIZE.
+        
+        Returns:
+            True if new downloads are currently rejected
+        """
+        return len(self.download_queue) >= self.max_queue_size
+    
     def list_active_downloads(self) -> Dict[str, Dict[str, Any]]:
         """List all active downloads.
         
@@ -572,8 +955,7 @@ class DownloadManager:
                 'status': info.status,
                 'speed': info.speed
             }
-            for info in self.active_downloads.values()
-            if info.status in ('downloading', 'waiting')
+            for info in map(self.active_downloads.__getitem__, self._active_ids)
         }
     
     def list_queued_downloads(self) -> List[Dict[str, Any]]:
@@ -592,39 +974,44 @@ class DownloadManager:
             for i, q in enumerate(self.download_queue)
         ]
     
-    def _cleanup_completed_downloads(self) -> None:
-        """Clean up completed, failed, or cancelled downloads."""
-        current_time = time.time()
-        to_remove = []
+    def _cleanup_completed_downloads(self) -> int:
+        """Clean up completed, failed, or cancelled downloads.
         
-        for key, info in self.active_downloads.items():
-            if info.status == 'cancelled':
-                to_remove.append(key)
-            elif info.status in ('completed', 'failed'):
-                if current_time - info.start_time > 30:
-                    to_remove.append(key)
+        Returns:
+            Number of download records removed
+        """
+        current_time = time.time()
+        removed = 0
         
-        for key in to_remove:
-            if key in self.active_downloads:
+        while self._expiry and self._expiry[0][0] <= current_time:
+            _, key = heapq.heappop(self._expiry)
+            # 记录可能已被 _delayed_cleanup 移除，跳过失效的堆项
+            if key in self._finished_ids:
                 logger.debug(f"Cleaning up download: {key}")
-                del self.active_downloads[key]
+                self._untrack_download(key)
+                removed += 1
+        
+        return removed
     
-    def _cleanup_partial_file(self, file_path: str) -> None:
-        """Remove a partial download file."""
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"Removed partial file: {file_path}")
-            except OSError as e:
-                logger.error(f"Failed to remove partial file: {e}")
+    async def _cleanup_partial_file(self, file_path: str) -> None:
+        """Remove a partial download file without blocking the event loop."""
+        await asyncio.to_thread(self._remove_partial_file, file_path)
+    
+    def _remove_partial_file(self, file_path: str) -> None:
+        """Remove a partial download file (blocking)."""
+        try:
+            os.remove(file_path)
+            logger.info(f"Removed partial file: {file_path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove partial file: {e}")
     
     async def _delayed_cleanup(self, key: str, delay: float) -> None:
         """Clean up download info after a delay."""
         await asyncio.sleep(delay)
-        if key in self.active_downloads:
-            status = self.active_downloads[key].status
-            if status in ('completed', 'failed', 'cancelled'):
-                del self.active_downloads[key]
+        if key in self._finished_ids:
+            self._untrack_download(key)
     
     async def process_telegram_link(
         self,
@@ -644,7 +1031,7 @@ class DownloadManager:
         Returns:
             Download ID if successful
         """
-        match = re.search(r't\.me/(c/)?([a-zA-Z0-9_]+)/(\d+)(?:\?comment=(\d+))?', link)
+        match = _TG_LINK_RE.search(link)
         if not match:
             await self._safe_edit_message(
                 client, chat_id, status_msg_id,
@@ -728,43 +1115,6 @@ class DownloadManager:
             logger.warning(f"解析评论消息失败 (post={post_id}, comment={comment_id}): {e}")
             return None
 
-    def _progress_callback(self, downloaded: int, total: int, download_id: str) -> None:
-        """Callback to track download progress."""
-        if download_id not in self.active_downloads:
-            return
-        
-        info = self.active_downloads[download_id]
-        if info.status == 'cancelled':
-            return
-        
-        # Determine if update is significant
-        if info.downloaded < 1024 * 1024:  # First 1MB
-            significant = True
-        else:
-            min_progress = min(256 * 1024, (total or 1) * 0.01)
-            significant = abs(downloaded - info.last_downloaded) >= min_progress
-        
-        if total and downloaded == total:
-            significant = True
-        
-        if significant:
-            info.downloaded = downloaded
-            if total and total > 0:
-                info.size = total
-            
-            # 当开始收到数据时，退出初始化阶段
-            if info.initial_phase and downloaded > 0:
-                info.initial_phase = False
-            
-            current_time = time.time()
-            elapsed = current_time - info.last_update_time
-            if elapsed >= 0.1:
-                downloaded_since = downloaded - info.last_downloaded
-                if elapsed > 0:
-                    info.speed = downloaded_since / elapsed
-                info.last_update_time = current_time
-                info.last_downloaded = downloaded
-    
     async def _update_progress(self, client: TelegramClient, download_id: str) -> None:
         """定期更新 Telegram 对话框中的进度消息。
         
@@ -774,44 +1124,57 @@ class DownloadManager:
         """
         min_edit_interval = 5.0  # 编辑消息的最小时间间隔（秒）
         client = self.messaging_client or client  # 进度消息始终经主客户端发送
+        info = self.active_downloads.get(download_id)
+        if info is None:
+            return
         try:
-            while download_id in self.active_downloads:
-                info = self.active_downloads[download_id]
-                
-                if info.status == 'downloading':
+            while not info.done_event.is_set():
+                # 先判断编辑间隔，未到间隔时不必构建进度文本
+                current_time = time.monotonic()
+                if (info.status == 'downloading'
+                        and current_time - info.last_edit_time >= min_edit_interval):
                     message = self._build_progress_message(info)
+                    message_hash = hash(message)
                     
-                    if message != info.last_message:
-                        current_time = time.time()
-                        time_since_last_edit = current_time - info.last_edit_time
-                        
-                        if time_since_last_edit >= min_edit_interval:
-                            try:
-                                await client.edit_message(info.chat_id, info.status_msg_id, message)
-                                info.last_message = message
-                                info.last_edit_time = current_time
-                                # 成功编辑后，逐步恢复正常间隔
-                                min_edit_interval = max(5.0, min_edit_interval * 0.7)
-                            except FloodWaitError as e:
-                                logger.warning(f"FloodWaitError on progress update: {e.seconds}s pause required.")
-                                await asyncio.sleep(e.seconds)
-                                # FloodWait 恢复后，加大间隔防止连环触发
-                                min_edit_interval = max(30.0, e.seconds * 0.3)
-                                logger.info(f"FloodWait recovered. Next edit interval set to {min_edit_interval:.0f}s.")
-                                continue
-                            except Exception as e:
-                                if "not modified" not in str(e).lower():
-                                    logger.debug(f"Edit message failed: {e}")
+                    if message_hash != info.last_message_hash:
+                        try:
+                            await self._edit_bucket.acquire()
+                            await client.edit_message(info.chat_id, info.status_msg_id, message)
+                            self._remember_edit(info.chat_id, info.status_msg_id, message)
+                            info.last_message_hash = message_hash
+                            info.last_edit_time = current_time
+                            # 成功编辑后，逐步恢复正常间隔
+                            min_edit_interval = max(5.0, min_edit_interval * 0.7)
+                        except FloodWaitError as e:
+                            logger.warning(f"FloodWaitError on progress update: {e.seconds}s pause required.")
+                            await asyncio.sleep(e.seconds)
+                            # FloodWait 恢复后，加大间隔防止连环触发
+                            min_edit_interval = max(30.0, e.seconds * 0.3)
+                            logger.info(f"FloodWait recovered. Next edit interval set to {min_edit_interval:.0f}s.")
+                            continue
+                        except Exception as e:
+                            if "not modified" not in str(e).lower():
+                                logger.debug(f"Edit message failed: {e}")
                 
-                # 根据文件大小动态调整轮询间隔
+                # 根据文件大小确定轮询间隔上限；若下次允许编辑的时刻更早，
+                # 则恰好在该时刻醒来，避免固定步长导致进度更新滞后一个周期
                 if info.initial_phase:
-                    await asyncio.sleep(3)
+                    cadence = 3
                 elif info.size > 500 * 1024 * 1024:
-                    await asyncio.sleep(10)
+                    cadence = 10
                 elif info.size > 100 * 1024 * 1024:
-                    await asyncio.sleep(7)
+                    cadence = 7
                 else:
-                    await asyncio.sleep(5)
+                    cadence = 5
+                until_edit = min_edit_interval - (time.monotonic() - info.last_edit_time)
+                try:
+                    await asyncio.wait_for(info.done_event.wait(), timeout=min(
+                        max(until_edit, config.PROGRESS_TICK_MIN),
+                        cadence,
+                        config.PROGRESS_TICK_MAX
+                    ))
+                except asyncio.TimeoutError:
+                    pass
                     
         except asyncio.CancelledError:
             pass
@@ -822,16 +1185,15 @@ class DownloadManager:
         """Build the progress message string."""
         if info.initial_phase and info.downloaded == 0:
             return (
-                f"⏬ Downloading: `{info.filename}`\n"
+                f"{info.progress_header}"
                 f"🔄 Establishing connection...\n"
                 f"⏱️ This might take a moment for large files\n"
                 f"🔢 Download ID: `{info.download_id}`"
             )
         
         percentage = int(info.downloaded * 100 / max(info.size, 1)) if info.size > 0 else 0
-        bar_length = 20
-        filled = int(bar_length * percentage / 100)
-        bar = '█' * filled + '░' * (bar_length - filled)
+        filled = min(int(_BAR_LENGTH * percentage / 100), _BAR_LENGTH)
+        bar = _BAR_TABLE[filled]
         
         speed_str = f"{format_size(info.speed)}/s"
         
@@ -841,13 +1203,13 @@ class DownloadManager:
             eta = format_time(remaining / info.speed)
         
         msg = (
-            f"⏬ Downloading: `{info.filename}`\n"
+            f"{info.progress_header}"
             f"🔄 Progress: |{bar}| {percentage}%\n"
             f"📊 {format_size(info.downloaded)}"
         )
         
         if info.size > 0:
-            msg += f" of {format_size(info.size)}\n"
+            msg += f" of {info.size_str or format_size(info.size)}\n"
         else:
             msg += " downloaded\n"
         
@@ -889,6 +1251,14 @@ class DownloadManager:
             f"**Path:** `{relative_path}`"
         )
     
+    def _remember_edit(self, chat_id: int, msg_id: int, text: str) -> None:
+        """Record the text a status message now shows, evicting the oldest entry."""
+        key = (chat_id, msg_id)
+        self._edit_cache[key] = text
+        self._edit_cache.move_to_end(key)
+        if len(self._edit_cache) > _EDIT_CACHE_SIZE:
+            self._edit_cache.popitem(last=False)
+    
     async def _safe_edit_message(
         self,
         client: TelegramClient,
@@ -897,10 +1267,27 @@ class DownloadManager:
         text: str
     ) -> bool:
         """安全地编辑消息（优先用消息客户端/主客户端），处理异常并在 FloodWait 后自动重试一次。"""
+        # 丢弃该消息尚未发出的合并编辑，避免旧的排队状态覆盖本次编辑
+        self._edit_coalescer.discard(chat_id, msg_id)
+        return await self._do_edit(client, chat_id, msg_id, text)
+    
+    async def _do_edit(
+        self,
+        client: TelegramClient,
+        chat_id: int,
+        msg_id: int,
+        text: str
+    ) -> bool:
+        """发送一次编辑；不触碰合并器，供直接编辑与合并器的定时发送共用。"""
+        if self._edit_cache.get((chat_id, msg_id)) == text:
+            # 消息已是该文本，省去一次必然返回 "not modified" 的请求
+            return True
         client = self.messaging_client or client
         for attempt in range(2):  # 最多尝试 2 次（首次 + FloodWait 后重试 1 次）
             try:
+                await self._edit_bucket.acquire()
                 await client.edit_message(chat_id, msg_id, text)
+                self._remember_edit(chat_id, msg_id, text)
                 return True
             except FloodWaitError as e:
                 logger.warning(f"FloodWaitError in safe edit message! Pausing for {e.seconds}s (attempt {attempt + 1}/2).")
@@ -3,13 +3,80 @@
 import os
 import time
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from dataclasses import dataclass, replace
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
 
 from .helpers import format_size, sanitize_filename
 
 logger = logging.getLogger(__name__)
 
+# cleanup_old_files 过期文件达到该数量时改用线程池并发删除
+_PARALLEL_REMOVE_THRESHOLD = 16
+_REMOVE_WORKERS = 8
+
+
+# 支持时以目录 fd 打开 scandir：DirEntry.stat() 走 fstatat，按文件名相对目录查找，
+# 不必每个文件都从根重新解析整条路径
+_SCANDIR_BY_FD = os.scandir in os.supports_fd and hasattr(os, 'O_DIRECTORY')
+
+
+@contextmanager
+def _scandir(path: str) -> Iterator[Iterator[os.DirEntry]]:
+    """Open a directory for scanning, through a directory fd where supported.
+    
+    Args:
+        path: Directory to list
+        
+    Yields:
+        The os.scandir iterator; entry.path is not used by callers
+    """
+    if not _SCANDIR_BY_FD:
+        with os.scandir(path) as entries:
+            yield entries
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        with os.scandir(fd) as entries:
+            yield entries
+    finally:
+        os.close(fd)
+
+
+def _try_remove(path: str) -> Optional[OSError]:
+    """Delete a file, returning the error instead of raising it.
+    
+    Args:
+        path: File to delete
+        
+    Returns:
+        None on success, otherwise the OSError raised by os.remove
+    """
+    try:
+        os.remove(path)
+    except OSError as e:
+        return e
+    return None
+
+
+@dataclass(slots=True)
+class FileInfo:
+    """A downloaded file in the listing (slotted: the cache holds one per file)."""
+    full_path: str
+    relative_path: str
+    filename: str
+    filename_lower: str  # 供搜索匹配，扫描时算一次
+    size_bytes: int
+    modified_time: float
+    
+    @property
+    def size(self) -> str:
+        """Human-readable size, formatted only when a listing is displayed."""
+        return format_size(self.size_bytes)
+
 
 class FileManager:
     """Manages downloaded files with caching and CRUD operations."""
@@ -22,16 +89,24 @@ class FileManager:
             cache_ttl: Cache time-to-live in seconds
         """
         self.base_dir = base_dir
-        self._files_cache: Optional[List[Dict[str, Any]]] = None
+        # 解析一次即可，_is_safe_path 每次只需解析待检查的路径
+        self._real_base = os.path.realpath(base_dir)
+        self._real_base_prefix = os.path.join(self._real_base, '')
+        self._files_cache: Optional[List[FileInfo]] = None
+        # 缓存中所有文件的总字节数，随缓存一起维护，get_stats 无需逐项求和
+        self._cache_total_size = 0
         self._cache_time: float = 0
         self._cache_ttl = cache_ttl
+        self._cache_signature: Optional[Tuple[int, ...]] = None
+        # 文件操作在线程池中执行：缓存及其签名的读-改-写都须持有此锁
+        self._lock = threading.Lock()
     
     def list_files(
         self, 
         offset: int = 0, 
         limit: Optional[int] = None,
         search: Optional[str] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> List[FileInfo]:
         """List all downloaded files with optional pagination and search.
         
         Args:
@@ -40,22 +115,16 @@ class FileManager:
             search: Optional search string to filter files by name
             
         Returns:
-            List of file info dictionaries
+            List of FileInfo records
         """
-        current_time = time.time()
+        with self._lock:
+            files = self._current_files()
         
-        # Use cached results if available and fresh
-        if self._files_cache is not None and current_time - self._cache_time < self._cache_ttl:
-            files = self._files_cache
-        else:
-            files = self._scan_files()
-            self._files_cache = files
-            self._cache_time = current_time
-        
-        # Apply search filter
+        # Apply search filter; only the requested page of matches is materialized
         if search:
             search_lower = search.lower()
-            files = [f for f in files if search_lower in f['filename'].lower()]
+            matches = (f for f in files if search_lower in f.filename_lower)
+            return list(islice(matches, offset, offset + limit if limit else None))
         
         # Apply pagination
         if limit:
@@ -64,73 +133,206 @@ class FileManager:
             return files[offset:]
         return files
     
-    def search_files(self, query: str) -> List[Dict[str, Any]]:
+    def _current_files(self) -> List[FileInfo]:
+        """Return the cached listing, refreshing it if it has expired.
+        
+        Must be called with self._lock held.
+        
+        Returns:
+            List of FileInfo records sorted by modification time
+        """
+        current_time = time.time()
+        
+        # Use cached results if available and fresh
+        if self._files_cache is not None and current_time - self._cache_time < self._cache_ttl:
+            return self._files_cache
+        
+        signature = self._dir_signature()
+        if self._files_cache is None or signature is None or signature != self._cache_signature:
+            files = self._scan_files()
+            self._files_cache = files
+            self._cache_total_size = sum(f.size_bytes for f in files)
+            self._cache_signature = self._settled(signature)
+        # Otherwise nothing was added, removed or renamed since the cache was last synced
+        self._cache_time = current_time
+        return self._files_cache
+    
+    def search_files(self, query: str, limit: Optional[int] = None) -> List[FileInfo]:
         """Search files by name.
         
+        Args:
+            query: Search query string
+            limit: Maximum number of matches to return
+            
+        Returns:
+            List of matching FileInfo records
+        """
+        return self.list_files(limit=limit, search=query)
+    
+    def count_matches(self, query: str) -> int:
+        """Count files whose name matches a search without building them into a list.
+        
         Args:
             query: Search query string
             
         Returns:
-            List of matching file info dictionaries
+            Number of matching files
         """
-        return self.list_files(search=query)
+        with self._lock:
+            files = self._current_files()
+        query_lower = query.lower()
+        return sum(1 for f in files if query_lower in f.filename_lower)
     
-    def _scan_files(self) -> List[Dict[str, Any]]:
+    def _scan_files(self, modified_before: Optional[float] = None) -> List[FileInfo]:
         """Scan the downloads directory for files.
         
+        Args:
+            modified_before: Only return files with an older mtime; newer files
+                are rejected right after stat, before a record is built
+        
         Returns:
-            List of file info dictionaries sorted by modification time
+            List of FileInfo records sorted by modification time
         """
-        files: List[Dict[str, Any]] = []
+        files: List[FileInfo] = []
         
         if not os.path.exists(self.base_dir):
             return files
         
-        for root, _, filenames in os.walk(self.base_dir):
-            for filename in filenames:
-                full_path = os.path.join(root, filename)
-                
-                # Skip partial/in-progress downloads or non-files
-                if not os.path.isfile(full_path) or filename.endswith(('.partial', '.downloading')):
-                    continue
-                
-                relative_path = os.path.relpath(full_path, self.base_dir)
-                
-                try:
-                    stat_info = os.stat(full_path)
-                    size_bytes = stat_info.st_size
-                    size = format_size(size_bytes)
-                    modified_time = stat_info.st_mtime
-                except OSError as e:
-                    logger.warning(f"Failed to stat file {full_path}: {e}")
-                    size = "Unknown"
-                    size_bytes = 0
-                    modified_time = 0
-                
-                files.append({
-                    'full_path': full_path,
-                    'relative_path': relative_path,
-                    'filename': filename,
-                    'size': size,
-                    'size_bytes': size_bytes,
-                    'modified_time': modified_time
-                })
+        # 显式栈遍历：DirEntry 自带 d_type，判断类型无需额外 stat，每个文件只 stat 一次
+        base_prefix = os.path.join(self.base_dir, '')
+        pending_dirs = ['']  # 相对 base_dir 的目录前缀
+        while pending_dirs:
+            rel_dir = pending_dirs.pop()
+            try:
+                with _scandir(base_prefix + rel_dir) as entries:
+                    for entry in entries:
+                        filename = entry.name
+                        relative_path = rel_dir + filename
+                        
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(relative_path + os.sep)
+                            continue
+                        
+                        # Skip partial/in-progress downloads or non-files
+                        if (not entry.is_file(follow_symlinks=False)
+                                or filename.endswith(('.partial', '.downloading'))):
+                            continue
+                        
+                        full_path = base_prefix + relative_path
+                        try:
+                            stat_info = entry.stat(follow_symlinks=False)
+                        except OSError as e:
+                            # 通常是列目录后文件已被删除，不再列出
+                            logger.warning(f"Failed to stat file {full_path}: {e}")
+                            continue
+                        if modified_before is not None and stat_info.st_mtime >= modified_before:
+                            continue
+                        
+                        files.append(FileInfo(
+                            full_path=full_path,
+                            relative_path=relative_path,
+                            filename=filename,
+                            filename_lower=filename.lower(),
+                            size_bytes=stat_info.st_size,
+                            modified_time=stat_info.st_mtime
+                        ))
+            except OSError as e:
+                logger.warning(f"Failed to scan directory {base_prefix + rel_dir}: {e}")
         
         # Sort by modification time (newest first)
-        files.sort(key=lambda x: x['modified_time'], reverse=True)
+        files.sort(key=lambda x: x.modified_time, reverse=True)
         
         return files
     
-    def get_file_by_index(self, index: int) -> Optional[Dict[str, Any]]:
+    def _dir_signature(self) -> Optional[Tuple[int, ...]]:
+        """Fingerprint the download tree by the mtimes of the base and its date folders.
+        
+        Creating, deleting or renaming a file updates its parent folder's mtime,
+        so an unchanged signature means the tree holds the same files.
+        
+        Returns:
+            Tuple of mtimes in nanoseconds, or None if the tree cannot be read
+        """
+        try:
+            mtimes = [os.stat(self.base_dir).st_mtime_ns]
+            with os.scandir(self.base_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        mtimes.append(entry.stat(follow_symlinks=False).st_mtime_ns)
+        except OSError:
+            return None
+        
+        return tuple(mtimes)
+    
+    @staticmethod
+    def _settled(signature: Optional[Tuple[int, ...]]) -> Optional[Tuple[int, ...]]:
+        """Return a signature taken alongside a scan if it is safe to store.
+        
+        Folders touched within the last two seconds make the signature unusable,
+        since coarse filesystem timestamps could hide a second change.
+        
+        Args:
+            signature: Result of _dir_signature()
+            
+        Returns:
+            The signature, or None if it cannot be trusted
+        """
+        if signature is None or max(signature) > time.time_ns() - 2_000_000_000:
+            return None
+        return signature
+    
+    def _cache_in_sync(self) -> bool:
+        """Check that the cache still matches the tree, before a write-through change.
+        
+        Returns:
+            True if the stored signature is unchanged, i.e. nothing else touched the tree
+        """
+        return self._cache_signature is not None and self._dir_signature() == self._cache_signature
+    
+    def _resign_cache(self, in_sync: bool) -> None:
+        """Re-fingerprint the tree after a write-through change to the cache.
+        
+        Our own rename/delete changes folder mtimes; storing the new signature
+        lets later expiries keep reusing the cache instead of rescanning. Like a
+        scan's signature it must have settled, since a file written by someone
+        else in the same timestamp tick would otherwise never be picked up. If
+        the cache was not in sync beforehand, the signature is dropped so the
+        next expiry rescans.
+        
+        Must be called with self._lock held.
+        
+        Args:
+            in_sync: Result of _cache_in_sync() taken before the change
+        """
+        self._cache_signature = self._settled(self._dir_signature()) if in_sync else None
+    
+    def _indexed_files(self) -> List[FileInfo]:
+        """Return the listing that /rename and /delete indexes refer to.
+        
+        Indexes are positions in the last /list output, i.e. the cached
+        listing, so it is used as-is even past its TTL: looking up an index
+        never rescans. Numbers shown by /search are positions within the
+        search results and are not valid here. Only when nothing is cached
+        (first use, or after a download invalidated it) is a listing built.
+        
+        Returns:
+            Cached listing, or a fresh one if there is none
+        """
+        with self._lock:
+            if self._files_cache is not None:
+                return self._files_cache
+            return self._current_files()
+    
+    def get_file_by_index(self, index: int) -> Optional[FileInfo]:
         """Get file info by index.
         
         Args:
             index: Zero-based file index
             
         Returns:
-            File info dictionary or None if not found
+            FileInfo or None if not found
         """
-        files = self.list_files()
+        files = self._indexed_files()
         if 0 <= index < len(files):
             return files[index]
         return None
@@ -145,9 +347,8 @@ class FileManager:
             True if path is safe, False otherwise
         """
         try:
-            real_base = os.path.realpath(self.base_dir)
             real_path = os.path.realpath(path)
-            return real_path.startswith(real_base + os.sep) or real_path == real_base
+            return real_path == self._real_base or real_path.startswith(self._real_base_prefix)
         except (OSError, ValueError):
             return False
     
@@ -166,7 +367,7 @@ class FileManager:
         if not safe_new_name or safe_new_name in ('.', '..'):
             return {'success': False, 'message': 'Invalid new name provided.'}
         
-        files = self.list_files()
+        files = self._indexed_files()
         
         if not files:
             return {'success': False, 'message': 'No files found'}
@@ -177,22 +378,25 @@ class FileManager:
         file_info = files[index]
         
         # Verify file is within base directory
-        if not self._is_safe_path(file_info['full_path']):
+        if not self._is_safe_path(file_info.full_path):
             return {'success': False, 'message': 'Security error: invalid file path'}
         
-        dir_name = os.path.dirname(file_info['full_path'])
+        dir_name = os.path.dirname(file_info.full_path)
         new_full_path = os.path.join(dir_name, safe_new_name)
         
         if os.path.exists(new_full_path):
             return {'success': False, 'message': f'Target file already exists: {safe_new_name}'}
         
         try:
-            os.rename(file_info['full_path'], new_full_path)
-            new_relative_path = os.path.relpath(new_full_path, self.base_dir)
-            
-            self._invalidate_cache()
+            with self._lock:
+                in_sync = self._cache_in_sync()
+                os.rename(file_info.full_path, new_full_path)
+                new_relative_path = os.path.relpath(new_full_path, self.base_dir)
+                
+                self._rename_in_cache(file_info.full_path, new_full_path, new_relative_path, safe_new_name)
+                self._resign_cache(in_sync)
             
-            logger.info(f"Renamed file: {file_info['relative_path']} -> {new_relative_path}")
+            logger.info("Renamed file: %s -> %s", file_info.relative_path, new_relative_path)
             
             return {
                 'success': True,
@@ -212,7 +416,7 @@ class FileManager:
         Returns:
             Result dictionary with success status and message
         """
-        files = self.list_files()
+        files = self._indexed_files()
         
         if not files:
             return {'success': False, 'message': 'No files found'}
@@ -223,18 +427,21 @@ class FileManager:
         file_info = files[index]
         
         # Verify file is within base directory
-        if not self._is_safe_path(file_info['full_path']):
+        if not self._is_safe_path(file_info.full_path):
             return {'success': False, 'message': 'Security error: invalid file path'}
         
         try:
-            os.remove(file_info['full_path'])
-            self._invalidate_cache()
+            with self._lock:
+                in_sync = self._cache_in_sync()
+                os.remove(file_info.full_path)
+                self._remove_from_cache({file_info.full_path})
+                self._resign_cache(in_sync)
             
-            logger.info(f"Deleted file: {file_info['relative_path']}")
+            logger.info("Deleted file: %s", file_info.relative_path)
             
             return {
                 'success': True,
-                'deleted_path': file_info['relative_path']
+                'deleted_path': file_info.relative_path
             }
         except OSError as e:
             logger.error(f"Failed to delete file: {e}")
@@ -252,32 +459,43 @@ class FileManager:
         if days <= 0:
             return {'success': False, 'message': 'Days must be positive', 'deleted_count': 0}
         
-        cutoff_time = datetime.now() - timedelta(days=days)
-        cutoff_timestamp = cutoff_time.timestamp()
+        cutoff_timestamp = time.time() - days * 86400
         
-        files = self.list_files()
-        deleted_count = 0
-        errors = []
-        
-        for file_info in files:
-            if file_info['modified_time'] < cutoff_timestamp:
-                # Verify path is safe before deletion
-                if not self._is_safe_path(file_info['full_path']):
-                    errors.append(f"{file_info['filename']}: invalid path")
-                    continue
-                
-                try:
-                    os.remove(file_info['full_path'])
-                    deleted_count += 1
-                    logger.info(f"Auto-cleanup deleted: {file_info['relative_path']}")
-                except OSError as e:
-                    errors.append(f"{file_info['filename']}: {e}")
-        
-        if deleted_count > 0:
-            self._invalidate_cache()
-        
-        # Clean up empty directories
-        self._cleanup_empty_dirs()
+        # 整个清理过程持有锁，期间的重命名/删除不会被缓存更新覆盖
+        with self._lock:
+            in_sync = self._cache_in_sync()
+            deleted_paths = set()
+            errors = []
+            
+            # 列表来自 _scan_files：不跟随符号链接、路径以 base_dir 为前缀拼接，
+            # 必然位于下载目录内，无需逐个 realpath 校验
+            if self._files_cache is not None:
+                expired = [f for f in self._current_files() if f.modified_time < cutoff_timestamp]
+            else:
+                # 缓存为空时（如每日自动清理）只为过期文件建记录，不为整棵树构建列表
+                expired = self._scan_files(modified_before=cutoff_timestamp)
+            paths = [f.full_path for f in expired]
+            if len(expired) < _PARALLEL_REMOVE_THRESHOLD:
+                results = map(_try_remove, paths)
+            else:
+                # 大批量删除时并发发出 unlink，网络存储上每次系统调用的延迟可以重叠
+                with ThreadPoolExecutor(max_workers=_REMOVE_WORKERS) as pool:
+                    results = list(pool.map(_try_remove, paths))
+            
+            for file_info, error in zip(expired, results):
+                if error is None:
+                    deleted_paths.add(file_info.full_path)
+                    logger.info("Auto-cleanup deleted: %s", file_info.relative_path)
+                else:
+                    errors.append(f"{file_info.filename}: {error}")
+            
+            # Clean up directories left empty by the deletions
+            self._cleanup_empty_dirs({os.path.dirname(path) for path in deleted_paths})
+            
+            deleted_count = len(deleted_paths)
+            if deleted_count > 0:
+                self._remove_from_cache(deleted_paths)
+            self._resign_cache(in_sync)
         
         return {
             'success': True,
@@ -285,25 +503,84 @@ class FileManager:
             'errors': errors if errors else None
         }
     
-    def _cleanup_empty_dirs(self) -> None:
-        """Remove empty directories in the downloads folder."""
-        if not os.path.exists(self.base_dir):
-            return
+    def _cleanup_empty_dirs(self, candidates: Set[str]) -> None:
+        """Remove directories in the downloads folder that have become empty.
+        
+        Only the given directories and their ancestors are tried, deepest first;
+        rmdir itself refuses non-empty directories, so no listing is needed.
+        A parent that is still in use is tried again from its other children,
+        since it may be empty once they are gone.
         
-        for root, dirs, files in os.walk(self.base_dir, topdown=False):
-            for dir_name in dirs:
-                dir_path = os.path.join(root, dir_name)
+        Args:
+            candidates: Directories that files were deleted from
+        """
+        base_prefix = os.path.join(self.base_dir, '')
+        removed: Set[str] = set()
+        for dir_path in sorted(candidates, key=lambda d: d.count(os.sep), reverse=True):
+            # Walk up towards base_dir, stopping at the first directory still in use
+            while dir_path.startswith(base_prefix) and dir_path not in removed:
                 try:
-                    if not os.listdir(dir_path):
-                        os.rmdir(dir_path)
-                        logger.debug(f"Removed empty directory: {dir_path}")
+                    os.rmdir(dir_path)
                 except OSError:
-                    pass
+                    break
+                removed.add(dir_path)
+                logger.debug("Removed empty directory: %s", dir_path)
+                dir_path = os.path.dirname(dir_path)
+    
+    # 写穿式更新：替换而非原地修改缓存列表，已返回给调用方的列表保持不变；
+    # 调用方须持有 self._lock
+    def _remove_from_cache(self, full_paths: Set[str]) -> None:
+        """Drop deleted files from the cached listing without rescanning.
+        
+        Args:
+            full_paths: Full paths of the files that were removed
+        """
+        if self._files_cache is not None:
+            kept = []
+            for f in self._files_cache:
+                if f.full_path in full_paths:
+                    self._cache_total_size -= f.size_bytes
+                else:
+                    kept.append(f)
+            self._files_cache = kept
+    
+    def _rename_in_cache(
+        self,
+        old_path: str,
+        new_path: str,
+        new_relative_path: str,
+        new_filename: str
+    ) -> None:
+        """Update a renamed file in the cached listing without rescanning.
+        
+        A rename keeps the modification time, so the sort order is unchanged.
+        
+        Args:
+            old_path: Full path before the rename
+            new_path: Full path after the rename
+            new_relative_path: New path relative to base_dir
+            new_filename: New file name
+        """
+        if self._files_cache is None:
+            return
+        self._files_cache = [
+            replace(
+                f,
+                full_path=new_path,
+                relative_path=new_relative_path,
+                filename=new_filename,
+                filename_lower=new_filename.lower()
+            ) if f.full_path == old_path else f
+            for f in self._files_cache
+        ]
     
     def _invalidate_cache(self) -> None:
         """Invalidate the file cache."""
-        self._files_cache = None
-        self._cache_time = 0
+        with self._lock:
+            self._files_cache = None
+            self._cache_total_size = 0
+            self._cache_time = 0
+            self._cache_signature = None
     
     def get_stats(self) -> Dict[str, Any]:
         """Get statistics about downloaded files.
@@ -311,8 +588,9 @@ class FileManager:
         Returns:
             Dictionary with file statistics
         """
-        files = self.list_files()
-        total_size = sum(f['size_bytes'] for f in files)
+        with self._lock:
+            files = self._current_files()
+            total_size = self._cache_total_size
         
         return {
             'total_files': len(files),
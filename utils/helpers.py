@@ -1,6 +1,14 @@
 """Common utility functions shared across modules."""
 
-from typing import Union
+import asyncio
+import os
+import re
+from typing import Optional, Union
+
+# Characters not allowed in file names (Windows invalid chars: < > : " / \ | ? * and controls)
+_INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
 
 
 def format_size(size_bytes: Union[int, float]) -> str:
@@ -15,17 +23,13 @@ def format_size(size_bytes: Union[int, float]) -> str:
     if size_bytes < 0:
         return "0 B"
     
-    units = ['B', 'KB', 'MB', 'GB', 'TB']
-    unit_index = 0
-    size = float(size_bytes)
-    
-    while size >= 1024 and unit_index < len(units) - 1:
-        size /= 1024
-        unit_index += 1
+    # Every 10 bits of the integer part is one unit step, so no divide-by-1024 loop
+    whole = int(size_bytes)
+    unit_index = min((whole.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1) if whole else 0
     
     if unit_index == 0:
-        return f"{int(size)} B"
-    return f"{size:.1f} {units[unit_index]}"
+        return f"{whole} B"
+    return f"{size_bytes / (1 << (10 * unit_index)):.1f} {_SIZE_UNITS[unit_index]}"
 
 
 def format_time(seconds: Union[int, float]) -> str:
@@ -63,16 +67,11 @@ def sanitize_filename(filename: str) -> str:
     Returns:
         Sanitized filename safe for filesystem operations
     """
-    import os
-    import re
-    
     # Get basename to prevent path traversal
     filename = os.path.basename(filename)
     
     # Remove or replace invalid characters
-    # Windows invalid chars: < > : " / \ | ? *
-    invalid_chars = r'[<>:"/\\|?*\x00-\x1f]'
-    filename = re.sub(invalid_chars, '_', filename)
+    filename = _INVALID_FILENAME_CHARS.sub('_', filename)
     
     # Remove leading/trailing dots and spaces
     filename = filename.strip('. ')
@@ -82,3 +81,35 @@ def sanitize_filename(filename: str) -> str:
         filename = 'unnamed_file'
     
     return filename
+
+
+class TokenBucket:
+    """Token bucket that paces outgoing Telegram requests to a fixed rate.
+    
+    Each request takes a token; a refill task returns the spent tokens once
+    per period and exits after an idle period. Requests beyond the rate wait
+    here in FIFO order instead of running into Telethon's flood-wait sleeps.
+    """
+    
+    def __init__(self, rate: int, period: float = 1.0):
+        self._tokens = asyncio.Semaphore(rate)
+        self._period = period
+        self._spent = 0
+        self._refill_task: Optional[asyncio.Task] = None
+    
+    async def acquire(self) -> None:
+        """Wait for a token."""
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+        await self._tokens.acquire()
+        self._spent += 1
+    
+    async def _refill(self) -> None:
+        """Return the tokens spent during the last period."""
+        while True:
+            await asyncio.sleep(self._period)
+            spent, self._spent = self._spent, 0
+            if not spent:
+                return
+            for _ in range(spent):
+                self._tokens.release()